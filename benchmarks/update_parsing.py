@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""Benchmark of the decoding of getUpdates responses
+
+It compares the default path (the body decoded to str and every model built by Response.from_text) with the lazy one
+(raw bytes decoded by decode_updates, models built only when needed) on a batch of 100 updates with long texts.
+Run it from the root of the repo:
+
+    python benchmarks/update_parsing.py
+"""
+
+import json
+import timeit
+
+from lib.lazy import decode_updates
+from lib.models import Response
+
+__author__ = "Claudio Pastorini (pincopallino93)"
+
+__license__ = "MIT"
+__version__ = "0.0.1"
+__status__ = "Development"
+
+
+def build_body(count=100, text_length=2000):
+    """
+    Return the raw body of a getUpdates response with count text messages, half of them replies.
+    """
+    updates = []
+    for i in range(count):
+        message = {"message_id": i, "date": 1435000000 + i, "text": "è" * text_length,
+                   "from": {"id": i, "first_name": "User", "last_name": "Name", "username": "user%d" % i},
+                   "chat": {"id": -1000 - i % 10, "title": "Group %d" % (i % 10)}}
+        if i % 2:
+            message["reply_to_message"] = dict(message, message_id=i - 1)
+        updates.append({"update_id": 1000 + i, "message": message})
+    return json.dumps({"ok": True, "result": updates}, ensure_ascii=False).encode("utf-8")
+
+
+def default_path(body):
+    for update in Response.from_text(body.decode("utf-8")).result:
+        update.message.text, update.message.chat.id
+
+
+def lazy_path(body):
+    for update in decode_updates(body):
+        update.message.text, update.message.chat_id
+
+
+def lazy_path_materialized(body):
+    for update in decode_updates(body):
+        update.message.text, update.message.chat_id
+        update.message.materialize()
+
+
+if __name__ == '__main__':
+    number = 200
+    for text_length in (20, 2000):
+        body = build_body(text_length=text_length)
+        print("Body of %d bytes, %d runs" % (len(body), number))
+        for function in (default_path, lazy_path, lazy_path_materialized):
+            seconds = min(timeit.repeat(lambda: function(body), number=number, repeat=5))
+            print("    %-24s %8.3f ms per batch" % (function.__name__, seconds / number * 1000))
@@ -1,6 +1,14 @@
+import threading
+
 import requests
 
 from lib.dispatcher import MessageDispatcher
+from lib.keyboard import KeyboardBuilder
+from lib.lazy import decode_updates, materialize
+from lib.transport import TransportStats, encode_form
+from lib.memoize import cached_response
+from lib.preprocessing import preprocess
+from lib.termination import TerminationHandler
 from lib.models import *
 
 
@@ -25,20 +33,43 @@ class TelegramBotAPI(MessageDispatcher):  # TODO Use singleton?
                    "sendDocument", "sendSticker", "sendVideo", "sendLocation", "sendChatAction", "getUserProfilePhotos",
                    "getUpdates", "setWebhook"]
 
-    def __init__(self, token=None, bot=None, debug=False):
+    def __init__(self, token=None, bot=None, debug=False, session=None):
         """
         :param token: String, It is a string along the lines of 110201543:AAHdqTcvCH1vGWJxfSeofSAs0K5PALDsaw that will
             be required to authorize the bot and send requests to the Bot API.
         :param bot: User, User that represent the  bot.
+        :param debug: Boolean, Optional. If True all responses are printed.
+        :param session: requests.Session, Optional. Session (and so connection pool) used for all requests, useful in
+            order to share it between many bots. By default a new one is created.
         """
         super().__init__()
         self._token = token
         self._bot = bot
         self._debug = debug
+        self._session = session if session is not None else requests.Session()
+        self._owns_session = session is None
+        self._cache = None
+        self._deduplicator = None
+        self._chat_actions = None
+        self._coalescer = None
+        self._lazy_updates = False
+        self._preprocessing = False
+        self._allowed_update_kinds = None
+        self._compress_threshold = None
+        self._transport_stats = TransportStats()
+        self._update_sinks = []
+        self._shedder = None
+        self._outbox = None
+        self._election = None
+        self._diagnostics = None
         self._offset = 0  # Default value for specification
         self._limit = 100  # Default value for specification
         self._timeout = 0  # Default value for specification
         self._base_url = ""
+        self._running = threading.Event()
+        self._thread = None
+        self._termination = TerminationHandler(self.stop)
+        self._closed = False
 
         if bot is None:
             self._refresh_base_url()  # Refresh base url
@@ -75,6 +106,162 @@ class TelegramBotAPI(MessageDispatcher):  # TODO Use singleton?
     def debug(self, value):
         self._debug = value
 
+    @property
+    def session(self):
+        """
+        Session used for all requests to the Bot API.
+        """
+        return self._session
+
+    @session.setter
+    def session(self, value):
+        self._session = value
+        self._owns_session = False  # Shared, so it is not closed on stop
+
+    @property
+    def cache(self):
+        """
+        EntityCache fed with all the dispatched messages, None if disabled.
+        """
+        return self._cache
+
+    @cache.setter
+    def cache(self, value):
+        self._cache = value
+
+    @property
+    def deduplicator(self):
+        """
+        UpdateDeduplicator that drops already seen updates before dispatching them, None if disabled.
+        """
+        return self._deduplicator
+
+    @deduplicator.setter
+    def deduplicator(self, value):
+        self._deduplicator = value
+
+    @property
+    def chat_actions(self):
+        """
+        ChatActionManager whose actions are cancelled when a message is sent to their chat, None if disabled.
+        """
+        return self._chat_actions
+
+    @chat_actions.setter
+    def chat_actions(self, value):
+        self._chat_actions = value
+
+    @property
+    def coalescer(self):
+        """
+        MessageCoalescer that merges consecutive plain text messages sent to the same chat, None if disabled.
+        """
+        return self._coalescer
+
+    @coalescer.setter
+    def coalescer(self, value):
+        self._coalescer = value
+
+    @property
+    def lazy_updates(self):
+        """
+        If True getUpdates decodes the raw bytes of the response and returns messages built only when needed, see
+        LazyMessage.
+        """
+        return self._lazy_updates
+
+    @lazy_updates.setter
+    def lazy_updates(self, value):
+        self._lazy_updates = value
+
+    @property
+    def preprocessing(self):
+        """
+        If True the TextFeatures of the messages admitted for dispatch are computed before dispatching them, each
+        distinct text once per batch, so routers and handlers reuse message.features instead of normalizing the text
+        again.
+        """
+        return self._preprocessing
+
+    @preprocessing.setter
+    def preprocessing(self, value):
+        self._preprocessing = value
+
+    @property
+    def shedder(self):
+        """
+        LoadShedder deciding which updates are dispatched when the client falls behind, None if disabled.
+        """
+        return self._shedder
+
+    @shedder.setter
+    def shedder(self, value):
+        self._shedder = value
+
+    @property
+    def outbox(self):
+        """
+        DurableOutbox through which the messages are sent, so they survive a crash, None if disabled.
+        """
+        return self._outbox
+
+    @outbox.setter
+    def outbox(self, value):
+        self._outbox = value
+
+    @property
+    def diagnostics(self):
+        """
+        MemoryDiagnostics watching the client, closed when the client stops. By default None.
+        """
+        return self._diagnostics
+
+    @diagnostics.setter
+    def diagnostics(self, value):
+        self._diagnostics = value
+
+    @property
+    def election(self):
+        """
+        LeaderElection that lets only one of many instances poll, None if disabled.
+        """
+        return self._election
+
+    @election.setter
+    def election(self, value):
+        self._election = value
+
+    @property
+    def allowed_update_kinds(self):
+        """
+        Collection of kinds of message (e.g. "text", "photo", "location", see lazy.MESSAGE_KINDS) to dispatch, the
+        others are dropped by getUpdates before building them. None in order to dispatch all of them.
+        """
+        return self._allowed_update_kinds
+
+    @allowed_update_kinds.setter
+    def allowed_update_kinds(self, value):
+        self._allowed_update_kinds = None if value is None else frozenset(value)
+
+    @property
+    def compress_threshold(self):
+        """
+        Size in bytes above which the bodies of the POSTs are sent compressed with gzip, None in order to never compress
+        them. Enable it only if the server accepts compressed requests.
+        """
+        return self._compress_threshold
+
+    @compress_threshold.setter
+    def compress_threshold(self, value):
+        self._compress_threshold = value
+
+    @property
+    def transport_stats(self):
+        """
+        TransportStats with the bytes on the wire for each method.
+        """
+        return self._transport_stats
+
     @property
     def offset(self):
         """
@@ -88,6 +275,13 @@ class TelegramBotAPI(MessageDispatcher):  # TODO Use singleton?
     def offset(self, value):
         self._offset = value
 
+    @property
+    def running(self):
+        """
+        True if the client is polling.
+        """
+        return self._running.is_set()
+
     @property
     def limit(self):
         """
@@ -119,13 +313,42 @@ class TelegramBotAPI(MessageDispatcher):  # TODO Use singleton?
         """
         self._base_url = "https://api.telegram.org/bot" + self._token + "/"
 
+    def _request(self, method, params=None, data=None):
+        """
+        Private method that performs a request to the Bot API through the session. Responses compressed with gzip or
+        deflate are decompressed while read, and the bytes on the wire are counted in transport_stats.
+        :param method: String, Name of the method to call.
+        :param params: Dict, Optional. Parameters sent in the query string.
+        :param data: Dict, Optional. Parameters sent in the body, if present a POST is performed.
+        :return: The requests.Response, with the body already read.
+        """
+        url = self._base_url + method
+        if data is None:
+            response = self._session.get(url, params=params, stream=True)
+            sent = 0
+        else:
+            body, headers = encode_form(data, self._compress_threshold)
+            response = self._session.post(url, data=body, headers=headers, stream=True)
+            sent = len(body)
+
+        decoded = len(response.content)
+        received = response.raw.tell() if hasattr(response.raw, "tell") else decoded
+        self._transport_stats.record(method, sent + len(response.request.url), received, decoded)
+        return response
+
+    def _call(self, method, params=None, data=None):
+        """
+        Private method that performs a request to the Bot API, see _request.
+        :return: The text of the response.
+        """
+        return self._request(method, params, data).text
+
     def getMe(self):
         """
         A simple method for testing your bot's auth token. Requires no parameters.
         :Returns basic information about the bot in form of a User object.
         """
-        url = self._base_url + self.METHOD_LIST[0]
-        response_text = requests.get(url).text
+        response_text = self._call(self.METHOD_LIST[0])
         response = Response.from_text(response_text)
         self._bot = response.result
 
@@ -139,7 +362,9 @@ class TelegramBotAPI(MessageDispatcher):  # TODO Use singleton?
         :param limit: Integer, Optional. Limits the number of updates to be retrieved. Values between 1—100 are
             accepted. Defaults to 100.
         :param timeout: Integer, Optional. Timeout in seconds for long polling. Defaults to 0, i.e. usual short polling.
-        :return: An Array of Update objects is returned.
+        :return: An Array of Update objects is returned. The offset is not moved until the updates are processed with
+            process_updates.
+        :raise APIError: If the request is refused, e.g. with 401 for a wrong token or 409 for a conflict.
         """
         if offset is None:
             offset = self._offset
@@ -150,19 +375,37 @@ class TelegramBotAPI(MessageDispatcher):  # TODO Use singleton?
 
         data = {"offset": offset, "limit": limit, "timeout": timeout}
 
-        url = self._base_url + self.METHOD_LIST[1]
-        response_text = requests.get(url, params=data).text
+        if self._lazy_updates or self._allowed_update_kinds is not None:
+            body = self._request(self.METHOD_LIST[1], params=data).content
+
+            if self._debug:  # If in debug mode, print all response
+                print(body.decode("utf-8"))
+
+            return decode_updates(body, self._allowed_update_kinds)
+
+        response_text = self._call(self.METHOD_LIST[1], params=data)
 
         if self._debug:  # If in debug mode, print all response
             print(response_text)
 
-        response = Response.from_text(response_text)
-        try:
-            self._offset = response.result[0].update_id
-        except IndexError:
-            self._offset = 0
+        response = json.loads(response_text)
+        if not response.get("ok"):
+            raise APIError(response.get("error_code"), response.get("description"))
+        return [self._build_update(update) for update in response.get("result", ())]
 
-        return response.result
+    def _build_update(self, update):
+        """
+        Private method that builds an Update decoded with json.loads without object hook. An update that cannot be
+        built, e.g. with fields unknown to the models, is returned without message: it would fail in the same way at
+        every poll, so it is confirmed and skipped instead.
+        :param update: Dict, The decoded update.
+        """
+        try:
+            return materialize(update)
+        except (KeyError, TypeError) as e:
+            if self._debug:  # If in debug mode, print the skipped update
+                print("Update %s skipped: %r" % (update.get("update_id"), e))
+            return Update(update["update_id"])
 
     def sendMessage(self, chat_id, text, disable_web_page_preview=None, reply_to_message_id=None, reply_markup=None):
         """
@@ -171,35 +414,271 @@ class TelegramBotAPI(MessageDispatcher):  # TODO Use singleton?
         :param text: String, Text of the message to be sent.
         :param disable_web_page_preview: Boolean, Optional. Disables link previews for links in this message.
         :param reply_to_message_id: Integer, Optional. If the message is a reply, ID of the original message.
-        :param reply_markup: ReplyKeyboardMarkup or ReplyKeyboardHide or ForceReply, Optional. Additional interface
-            options. A JSON-serialized object for a custom reply keyboard, instructions to hide keyboard or to force a
-            reply from the user.
-        :return: On success, the sent Message is returned.
+        :param reply_markup: ReplyKeyboardMarkup or ReplyKeyboardHide or ForceReply or KeyboardBuilder, Optional.
+            Additional interface options. A JSON-serialized object for a custom reply keyboard, instructions to hide
+            keyboard or to force a reply from the user.
+        :return: On success, the sent Message is returned. None if the message is delayed by the coalescer or queued
+            in the outbox.
         """
         if chat_id is not "" and text is not "":
+            if self._chat_actions is not None:
+                self._chat_actions.cancel(chat_id)
+
+            if isinstance(reply_markup, KeyboardBuilder):
+                reply_markup = reply_markup.to_json()
+            elif isinstance(reply_markup, Jsonable):
+                reply_markup = Jsonable.to_json(reply_markup)
+
             data = {"chat_id": chat_id,
                     "text": text,
                     "disable_web_page_preview": disable_web_page_preview,
                     "reply_to_message_id": reply_to_message_id,
                     "reply_markup": reply_markup}
 
-            url = self._base_url + self.METHOD_LIST[3]
-            response = json.loads(requests.post(url, data=data).text)
-            return response
+            if self._coalescer is not None:
+                return self._coalescer.send(data)
+            return self._send_message(data)
 
-    def dispatch_message(self, message):
+    def _send_message(self, data):
         """
-        Override of dispatch_message in order to increase also message offset.
+        Private method that sends a message, through the outbox if any.
+        :param data: Dict, Parameters of sendMessage.
+        :return: The response of the server, None if queued in the outbox.
         """
-        super().dispatch_message(message)
-        self._offset += 1
+        if self._outbox is not None:
+            self._outbox.send(data)
+            return None
+        return self._deliver_message(data)
+
+    def _deliver_message(self, data):
+        """
+        Private method that performs sendMessage.
+        :param data: Dict, Parameters of sendMessage.
+        :return: The response of the server.
+        """
+        response = json.loads(self._call(self.METHOD_LIST[3], data=data))
+        return response
+
+    def forwardMessage(self, chat_id, from_chat_id, message_id):
+        """
+        Use this method to forward messages of any kind. See ForwardFanOut in order to forward to many chats.
+        :param chat_id: Integer, Unique identifier for the message recipient — User or GroupChat id.
+        :param from_chat_id: Integer, Unique identifier for the chat where the original message was sent — User or
+            GroupChat id.
+        :param message_id: Integer, Unique message identifier.
+        :return: The response of the server, on success with the sent Message.
+        """
+        if self._chat_actions is not None:
+            self._chat_actions.cancel(chat_id)
+
+        data = {"chat_id": chat_id, "from_chat_id": from_chat_id, "message_id": message_id}
+        return json.loads(self._call(self.METHOD_LIST[4], data=data))
+
+    def sendChatAction(self, chat_id, action):
+        """
+        Use this method when you need to tell the user that something is happening on the bot's side. The status is set
+        for 5 seconds or less (when a message arrives from your bot, Telegram clients clear its typing status). See
+        ChatActionManager in order to keep it alive for long tasks.
+        :param chat_id: Integer, Unique identifier for the message recipient — User or GroupChat id.
+        :param action: String, Type of action to broadcast: typing for text messages, upload_photo for photos,
+            record_video or upload_video for videos, record_audio or upload_audio for audio files, upload_document for
+            general files, find_location for location data. See ChatAction.
+        :return: The response of the server.
+        """
+        data = {"chat_id": chat_id, "action": action}
+        return json.loads(self._call(self.METHOD_LIST[11], data=data))
+
+    def getUserProfilePhotos(self, user_id, offset=None, limit=None):
+        """
+        Use this method to get a list of profile pictures for a user. See iter_user_profile_photos in order to walk
+        all of them.
+        :param user_id: Integer, Unique identifier of the target user.
+        :param offset: Integer, Optional. Sequential number of the first photo to be returned. By default, all photos
+            are returned.
+        :param limit: Integer, Optional. Limits the number of photos to be retrieved. Values between 1—100 are
+            accepted. Defaults to 100.
+        :return: Returns a UserProfilePhotos object.
+        :raise APIError: If the request is refused, e.g. with 400 for a wrong user or 429 when rate limited.
+        """
+        data = {"user_id": user_id, "offset": offset, "limit": limit}
+        response_text = self._call(self.METHOD_LIST[12], params=data)
+        response = Response.from_text(response_text)
+        if not response.ok:
+            raise APIError(response.error_code, response.description)
+        return response.result
+
+    def route_message(self, message):
+        """
+        Override of route_message in order to feed the cache with the messages that passed the filters.
+        """
+        if self._cache is not None:
+            self._cache.feed(message)
+        return super().route_message(message)
+
+    def add_update_sink(self, sink):
+        """
+        Add a sink called with every update, not already seen, before dispatching its message.
+        :param sink: Function, Function that takes an Update, e.g. ColumnarUpdateLog.append.
+        """
+        self._update_sinks.append(sink)
+
+    def remove_update_sink(self, sink):
+        """
+        Remove an update sink.
+        :param sink: Function, Sink to remove.
+        """
+        self._update_sinks.remove(sink)
+
+    def process_updates(self, updates, abort=None):
+        """
+        Dispatch a batch of updates received with getUpdates or through a webhook, moving the offset after each one.
+        :param updates: Array of Update, Updates to dispatch.
+        :param abort: threading.Event, Optional. If set, the updates not dispatched yet are left, with the offset, for
+            the next poll.
+        """
+        features = dict() if self._preprocessing else None  # Shared by the messages of the batch
+
+        for index, update in enumerate(updates):
+            if abort is not None and abort.is_set():
+                return
+            depth = len(updates) - index - 1  # Updates waiting behind this one
+            if self._deduplicator is None or self._deduplicator.accept(update.update_id):
+                for sink in self._update_sinks:
+                    sink(update)
+                if update.message is not None and \
+                        (self._shedder is None or self._shedder.admit(update.message, depth)):
+                    if features is not None:
+                        preprocess((update.message,), features)
+                    self.dispatch_message(update.message)
+            self._offset = max(self._offset, update.update_id + 1)
+
+    def commit_offset(self):
+        """
+        Confirm to the server all the processed updates, so they are not received again after a restart.
+        """
+        if self._offset:
+            self._call(self.METHOD_LIST[1], params={"offset": self._offset, "limit": 1, "timeout": 0})
+
+    def cached(self, ttl=None, maxsize=1024, context=()):
+        """
+        A decorator useful in order to cache the response of a listener that returns it instead of sending it, see
+        memoize.cached_response.
+        Example:
+            @api.respond_to("/help")
+            @api.cached(ttl=3600)
+            def respond(message):
+                return "Send /start in order to start."
+
+        :param ttl: Float, Optional. Seconds a response is valid, by default forever.
+        :param maxsize: Integer, Optional. Maximum number of cached responses.
+        :param context: Tuple, Optional. What else, beside the text, the response depends on.
+        """
+        return cached_response(self, ttl, maxsize, context)
 
     def run(self):
         """
-        This method starts the client.
+        This method starts the client and blocks until stop is called or SIGTERM is received. A stopped client can not
+        be started again, since its helpers are closed: create a new one.
+        """
+        if self._closed:
+            raise Exception("Client closed")
+
+        self._running.set()
+        self._termination.install(background=False)
+        try:
+            self._loop()
+        finally:
+            self._termination.restore()
+
+    def start(self):
+        """
+        This method starts the client in a background thread and returns immediately. On SIGTERM the client is stopped,
+        and then the previous handler of the signal is called, see TerminationHandler. As with run, a stopped client can
+        not be started again.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self._closed:
+            raise Exception("Client closed")
+
+        self._running.set()
+        self._termination.install(background=True)
+        self._thread = threading.Thread(target=self._loop, name="TelegramBotAPI")
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop polling. The current batch of updates is dispatched to the end, the offset is committed and the pooled
+        connections are closed. A long poll in progress is waited, so it can take up to the polling timeout.
+        :param timeout: Float, Optional. Maximum seconds to wait for the client started with start, by default waits
+            until it is stopped.
+        :return: True if the client is stopped, False if the timeout expired.
+        """
+        self._running.clear()
+        if self._thread is None or self._thread is threading.current_thread():
+            return True
+
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return False
+        self._termination.restore()
+        return True
+
+    def _loop(self):
+        """
+        Private method that polls until the client is stopped.
+        """
+        try:
+            while self._running.is_set():
+                if self._election is not None:
+                    self._election.poll(self)
+                else:
+                    self.process_updates(self.getUpdates())
+        finally:
+            self._running.clear()
+            self._shutdown()
+
+    def _shutdown(self):
         """
-        while True:
-            updates = self.getUpdates()
+        Private method that closes the client and releases the connections.
+        """
+        self.close()
+
+        if self._owns_session:
+            self._session.close()
+
+    def close(self):
+        """
+        Send the messages delayed by the coalescer, wait a bit for the outbox, commit the offset, release the lease,
+        flush the state store and stop the helpers. Called when the client stops; call it when the updates are
+        dispatched by someone else, e.g. a BotMultiplexer. The session is left open, and the client can not be started
+        again.
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        if self._coalescer is not None:
+            self._coalescer.close()  # Send the delayed messages
+
+        if self._outbox is not None:
+            self._outbox.close()  # Wait a bit for the queued messages, the others are sent at the next start
+
+        if self._election is None or self._election.leader:  # A standby has nothing to commit
+            try:
+                self.commit_offset()
+            except requests.RequestException as e:
+                if self._debug:
+                    print(e)
+
+        if self._election is not None:
+            self._election.release(self)
+
+        if self._state_store is not None:
+            self._state_store.flush()  # The store can be shared, so it is not closed
+
+        if self._chat_actions is not None:
+            self._chat_actions.close()
 
-            for update in updates:
-                self.dispatch_message(update.message)
+        if self._diagnostics is not None:
+            self._diagnostics.close()
@@ -0,0 +1,262 @@
+import json
+import mmap
+import os
+from array import array
+
+
+class MediaType(object):
+    """
+    Codes of the kind of content of a message stored in the media column.
+    """
+
+    NONE = 0
+    TEXT = 1
+    AUDIO = 2
+    DOCUMENT = 3
+    PHOTO = 4
+    STICKER = 5
+    VIDEO = 6
+    CONTACT = 7
+    LOCATION = 8
+
+    FIELDS = (("text", TEXT), ("audio", AUDIO), ("document", DOCUMENT), ("photo", PHOTO), ("sticker", STICKER),
+              ("video", VIDEO), ("contact", CONTACT), ("location", LOCATION))
+
+
+# Column name -> array typecode, all integers are 64 bits wide and in native byte order
+COLUMNS = (("update_id", "q"), ("message_id", "q"), ("date", "q"), ("chat_id", "q"), ("sender_id", "q"),
+           ("media", "B"), ("text_end", "q"))
+
+
+class ColumnarUpdateLog(object):
+    """
+    Update sink that appends the received updates to a column-oriented log, much smaller and faster to scan than
+    lists of Message or JSON lines. You can simply use it in this way:
+
+        log = ColumnarUpdateLog("updates")
+        api.add_update_sink(log.append)
+
+    Each column is an array kept in memory and written, every chunk_size updates, as a raw file that can be memory
+    mapped by ColumnarUpdateReader. Texts are written in a UTF-8 heap, text_end is the end of the text of each row in
+    it. Remember to call close() in order to write the last chunk.
+    """
+
+    def __init__(self, directory, chunk_size=65536):
+        """
+        :param directory: String, Directory of the log, created if missing.
+        :param chunk_size: Integer, Optional. Number of updates of each chunk.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._chunk_size = chunk_size
+        self._chunk = len(_chunk_names(directory))
+        self._reset()
+
+    def __len__(self):
+        """
+        Return the number of updates not written yet.
+        """
+        return len(self._columns["update_id"])
+
+    def _reset(self):
+        """
+        Private method that starts a new chunk in memory.
+        """
+        self._columns = {name: array(typecode) for name, typecode in COLUMNS}
+        self._heap = bytearray()
+
+    def append(self, update):
+        """
+        Append an update, updates without a message are skipped.
+        :param update: Update, Update to append.
+        """
+        message = update.message
+        if message is None:
+            return
+
+        raw = getattr(message, "raw", None)  # A LazyMessage is read without building it
+        if raw is not None:
+            chat_id = raw["chat"]["id"]
+            sender_id = raw["from"]["id"] if "from" in raw else 0
+            media = next((code for field, code in MediaType.FIELDS if field in raw), MediaType.NONE)
+        else:
+            chat_id = message.chat.id
+            sender_id = message.message_from.id if message.message_from is not None else 0
+            media = next((code for field, code in MediaType.FIELDS if getattr(message, field) is not None),
+                         MediaType.NONE)
+
+        if message.text is not None:
+            self._heap += message.text.encode("utf-8")
+
+        columns = self._columns
+        columns["update_id"].append(update.update_id)
+        columns["message_id"].append(message.message_id)
+        columns["date"].append(message.date)
+        columns["chat_id"].append(chat_id)
+        columns["sender_id"].append(sender_id)
+        columns["media"].append(media)
+        columns["text_end"].append(len(self._heap))
+
+        if len(columns["update_id"]) >= self._chunk_size:
+            self.flush()
+
+    def __call__(self, update):
+        """
+        Same as append, so the log can be used directly as an update sink.
+        """
+        self.append(update)
+
+    def flush(self):
+        """
+        Write the updates in memory as a new chunk.
+        """
+        dates = self._columns["date"]
+        if not dates:
+            return
+
+        path = os.path.join(self._directory, "chunk-%08d" % self._chunk)
+        temporary = path + ".tmp"
+        os.makedirs(temporary, exist_ok=True)
+        for name, column in self._columns.items():
+            with open(os.path.join(temporary, name + ".bin"), "wb") as f:
+                column.tofile(f)
+        with open(os.path.join(temporary, "text.bin"), "wb") as f:
+            f.write(self._heap)
+        with open(os.path.join(temporary, "meta.json"), "w") as f:
+            json.dump({"count": len(dates), "min_date": min(dates), "max_date": max(dates)}, f)
+        os.rename(temporary, path)  # A chunk is visible to readers only when complete
+
+        self._chunk += 1
+        self._reset()
+
+    def close(self):
+        """
+        Write the last chunk.
+        """
+        self.flush()
+
+
+class ColumnarUpdateReader(object):
+    """
+    Reader of a ColumnarUpdateLog. Columns are memory mapped, and filters skip whole chunks using their date range
+    before scanning the columns, so no Message is ever built. For example:
+
+        reader = ColumnarUpdateReader("updates")
+        for update_id, date, text in reader.rows(("update_id", "date", "text"), chat_id=chat_id, since=yesterday):
+            print(update_id, date, text)
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: String, Directory of the log.
+        """
+        self._chunks = []
+        for name in _chunk_names(directory):
+            path = os.path.join(directory, name)
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+            self._chunks.append((path, meta))
+        self._maps = dict()  # (chunk, column) -> (mmap, memoryview of the mmap, typed memoryview)
+
+    def __len__(self):
+        """
+        Return the number of updates in the log.
+        """
+        return sum(meta["count"] for _, meta in self._chunks)
+
+    @property
+    def chunks(self):
+        """
+        Number of chunks of the log.
+        """
+        return len(self._chunks)
+
+    def column(self, chunk, name):
+        """
+        Return a column of a chunk as a memoryview of integers, or of bytes for text.
+        :param chunk: Integer, Index of the chunk.
+        :param name: String, Name of the column or "text" for the heap.
+        """
+        key = (chunk, name)
+        if key not in self._maps:
+            path = os.path.join(self._chunks[chunk][0], name + ".bin")
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    self._maps[key] = (None, None, memoryview(b""))
+                else:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    view = memoryview(mapped)
+                    self._maps[key] = (mapped, view, view.cast(dict(COLUMNS).get(name, "B")))
+        return self._maps[key][2]
+
+    def text(self, chunk, row):
+        """
+        Return the text of a row, None if the message has no text.
+        :param chunk: Integer, Index of the chunk.
+        :param row: Integer, Index of the row in the chunk.
+        """
+        ends = self.column(chunk, "text_end")
+        start = ends[row - 1] if row > 0 else 0
+        if start == ends[row] and self.column(chunk, "media")[row] != MediaType.TEXT:
+            return None
+        return bytes(self.column(chunk, "text")[start:ends[row]]).decode("utf-8")
+
+    def select(self, chat_id=None, sender_id=None, since=None, until=None, media=None):
+        """
+        Return the rows matching all the given conditions.
+        :param chat_id: Integer, Optional. Unique identifier of the chat.
+        :param sender_id: Integer, Optional. Unique identifier of the sender.
+        :param since: Integer, Optional. Minimum date in Unix time, included.
+        :param until: Integer, Optional. Maximum date in Unix time, excluded.
+        :param media: Integer, Optional. Kind of content, see MediaType.
+        :return: An Array of (chunk, Array of rows) for the chunks with at least a matching row.
+        """
+        selected = []
+        for chunk, (_, meta) in enumerate(self._chunks):
+            if (since is not None and meta["max_date"] < since) or (until is not None and meta["min_date"] >= until):
+                continue  # Whole chunk out of the range
+
+            rows = range(meta["count"])
+            for name, value in (("chat_id", chat_id), ("sender_id", sender_id), ("media", media)):
+                if value is not None:
+                    column = self.column(chunk, name)
+                    rows = [row for row in rows if column[row] == value]
+            if since is not None or until is not None:
+                dates = self.column(chunk, "date")
+                low = float("-inf") if since is None else since
+                high = float("inf") if until is None else until
+                rows = [row for row in rows if low <= dates[row] < high]
+
+            if rows:
+                selected.append((chunk, list(rows)))
+        return selected
+
+    def rows(self, columns, **conditions):
+        """
+        Generator of the values of some columns for the rows matching the conditions, see select.
+        :param columns: Tuple of String, Names of the columns, "text" for the text.
+        """
+        for chunk, rows in self.select(**conditions):
+            views = [None if name == "text" else self.column(chunk, name) for name in columns]
+            for row in rows:
+                yield tuple(self.text(chunk, row) if view is None else view[row] for view in views)
+
+    def close(self):
+        """
+        Release all the memory maps.
+        """
+        for mapped, view, typed in self._maps.values():
+            typed.release()
+            if mapped is not None:
+                view.release()
+                mapped.close()
+        self._maps.clear()
+
+
+def _chunk_names(directory):
+    """
+    Return the names of the complete chunks of a log, in order.
+    """
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if name.startswith("chunk-") and not name.endswith(".tmp"))
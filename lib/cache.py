@@ -0,0 +1,164 @@
+from collections import OrderedDict
+
+from lib.models import User
+
+
+class EntityCache(object):
+    """
+    Bounded LRU cache of users, chats and recent messages fed with the dispatched messages.
+    You can simply use it in this way:
+
+        api.cache = EntityCache()
+
+
+        @api.respond_to("/whois")
+        def respond(message):
+            replied = api.cache.get_message(message.chat.id, message.reply_to_message.message_id)
+
+    Identical User and GroupChat are interned by id, so all the messages of a chat share the same objects.
+    """
+
+    def __init__(self, max_users=10000, max_chats=10000, messages_per_chat=50, max_messages=100000):
+        """
+        :param max_users: Integer, Optional. Maximum number of cached users.
+        :param max_chats: Integer, Optional. Maximum number of cached chats.
+        :param messages_per_chat: Integer, Optional. Number of recent messages kept for each chat.
+        :param max_messages: Integer, Optional. Maximum number of cached messages between all chats, when exceeded the
+            messages of the least recently used chat are evicted.
+        """
+        self._max_users = max_users
+        self._max_chats = max_chats
+        self._messages_per_chat = messages_per_chat
+        self._max_messages = max_messages
+        self._users = OrderedDict()
+        self._chats = OrderedDict()
+        self._messages = OrderedDict()  # chat id -> OrderedDict of message id -> Message
+        self._message_count = 0
+
+    def __len__(self):
+        """
+        Return the number of cached messages.
+        """
+        return self._message_count
+
+    def get_user(self, user_id):
+        """
+        Return the cached User or None.
+        :param user_id: Integer, Unique identifier of the user.
+        """
+        return self._touch(self._users, user_id)
+
+    def get_chat(self, chat_id):
+        """
+        Return the cached User or GroupChat representing the chat or None.
+        :param chat_id: Integer, Unique identifier of the chat.
+        """
+        return self._touch(self._chats, chat_id)
+
+    def get_message(self, chat_id, message_id):
+        """
+        Return a recent Message of a chat or None.
+        :param chat_id: Integer, Unique identifier of the chat.
+        :param message_id: Integer, Unique identifier of the message.
+        """
+        messages = self._messages.get(chat_id)
+        if messages is None:
+            return None
+        return messages.get(message_id)
+
+    def recent_messages(self, chat_id):
+        """
+        Return the recent messages of a chat, from the oldest to the newest.
+        :param chat_id: Integer, Unique identifier of the chat.
+        """
+        messages = self._messages.get(chat_id)
+        if messages is None:
+            return []
+        return list(messages.values())
+
+    def feed(self, message):
+        """
+        Intern the users and the chat of a message and keep the message among the recent ones of its chat.
+        :param message: Message, Message to cache.
+        :return: The same message, with its users and chat replaced by the interned ones.
+        """
+        message._from = self._intern_user(message.message_from)
+        message._forward_from = self._intern_user(message.forward_from)
+        message._new_chat_participant = self._intern_user(message.new_chat_participant)
+        message._left_chat_participant = self._intern_user(message.left_chat_participant)
+        message._chat = self._intern_chat(message.chat)
+
+        if message.reply_to_message is not None:
+            reply = message.reply_to_message
+            reply._from = self._intern_user(reply.message_from)
+            reply._chat = message.chat
+
+        self._add_message(message)
+        return message
+
+    def _intern_user(self, user):
+        """
+        Private method that return the cached User equal to user, caching it if missing or changed.
+        """
+        return self._intern(self._users, self._max_users, user)
+
+    def _intern_chat(self, chat):
+        """
+        Private method that return the cached chat equal to chat, caching it if missing or changed. Private chats are
+        Users, so they are interned with the other users.
+        """
+        if isinstance(chat, User):
+            chat = self._intern_user(chat)
+        return self._intern(self._chats, self._max_chats, chat)
+
+    @staticmethod
+    def _intern(entities, limit, entity):
+        """
+        Private method that interns an entity by id in a LRU dict.
+        """
+        if entity is None:
+            return None
+
+        cached = entities.get(entity.id)
+        if cached is entity or (cached is not None and cached.__dict__ == entity.__dict__):
+            entities.move_to_end(entity.id)
+            return cached
+
+        entities[entity.id] = entity  # New or changed (e.g. renamed), the newest wins
+        entities.move_to_end(entity.id)
+        if len(entities) > limit:
+            entities.popitem(last=False)
+        return entity
+
+    @staticmethod
+    def _touch(entities, key):
+        """
+        Private method that return an entity of a LRU dict marking it as recently used.
+        """
+        entity = entities.get(key)
+        if entity is not None:
+            entities.move_to_end(key)
+        return entity
+
+    def _add_message(self, message):
+        """
+        Private method that adds a message to the recent ones of its chat, evicting the old ones.
+        """
+        chat_id = message.chat.id
+        messages = self._messages.get(chat_id)
+        if messages is None:
+            messages = self._messages[chat_id] = OrderedDict()
+        else:
+            self._messages.move_to_end(chat_id)
+
+        if message.message_id not in messages:
+            self._message_count += 1
+        messages[message.message_id] = message
+
+        if len(messages) > self._messages_per_chat:
+            messages.popitem(last=False)
+            self._message_count -= 1
+
+        while self._message_count > self._max_messages and len(self._messages) > 1:
+            _, evicted = self._messages.popitem(last=False)
+            self._message_count -= len(evicted)
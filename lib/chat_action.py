@@ -0,0 +1,154 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+
+class ChatAction(object):
+    """
+    Type of action to broadcast with sendChatAction.
+    """
+
+    TYPING = "typing"
+    UPLOAD_PHOTO = "upload_photo"
+    RECORD_VIDEO = "record_video"
+    UPLOAD_VIDEO = "upload_video"
+    RECORD_AUDIO = "record_audio"
+    UPLOAD_AUDIO = "upload_audio"
+    UPLOAD_DOCUMENT = "upload_document"
+    FIND_LOCATION = "find_location"
+
+
+class ChatActionManager(object):
+    """
+    Keep a chat action alive for long-running listeners. You can simply use it in this way:
+
+        api.chat_actions = ChatActionManager(api)
+
+
+        @api.respond_to("/report")
+        def respond(message):
+            with api.chat_actions.keep(message.chat.id, ChatAction.TYPING):
+                report = build_report()
+            api.sendMessage(message.chat.id, report)
+
+    An action lasts about 5 seconds on clients, so it is sent again at most once per interval for each chat, no matter
+    how many listeners keep it. The action of a chat is cancelled as soon as a message is sent to it, since clients
+    hide it anyway.
+    """
+
+    def __init__(self, api, interval=4.5):
+        """
+        :param api: TelegramBotAPI, Client used in order to send the actions.
+        :param interval: Float, Optional. Seconds between two sends of the action of the same chat.
+        """
+        self._api = api
+        self._interval = interval
+        self._active = dict()  # chat id -> [action, number of keepers, time of the last send]
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def __len__(self):
+        """
+        Return the number of chats with an action alive.
+        """
+        return len(self._active)
+
+    @contextmanager
+    def keep(self, chat_id, action=ChatAction.TYPING):
+        """
+        Context manager that keeps an action alive in a chat until exit.
+        :param chat_id: Integer, Unique identifier for the target chat.
+        :param action: String, Type of action to broadcast, see ChatAction.
+        """
+        self.acquire(chat_id, action)
+        try:
+            yield
+        finally:
+            self.release(chat_id)
+
+    def acquire(self, chat_id, action=ChatAction.TYPING):
+        """
+        Start keeping an action alive in a chat, each acquire must be followed by a release.
+        :param chat_id: Integer, Unique identifier for the target chat.
+        :param action: String, Type of action to broadcast, see ChatAction.
+        """
+        with self._condition:
+            entry = self._active.get(chat_id)
+            if entry is None:
+                self._active[chat_id] = [action, 1, None]
+            else:
+                entry[1] += 1
+                if entry[0] == action:
+                    return  # Already alive, coalesced
+                entry[0] = action
+                entry[2] = None  # A different action replaces the current one immediately
+
+            self._ensure_thread()
+            self._condition.notify()
+
+    def release(self, chat_id):
+        """
+        Stop keeping the action alive in a chat when all its keepers are released.
+        :param chat_id: Integer, Unique identifier for the target chat.
+        """
+        with self._condition:
+            entry = self._active.get(chat_id)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._active[chat_id]
+
+    def cancel(self, chat_id):
+        """
+        Stop keeping the action alive in a chat, no matter how many keepers it has.
+        :param chat_id: Integer, Unique identifier for the target chat.
+        """
+        with self._condition:
+            self._active.pop(chat_id, None)
+
+    def close(self):
+        """
+        Cancel all the actions and stop the refresh thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._active.clear()
+            self._condition.notify()
+
+    def _ensure_thread(self):
+        """
+        Private method that starts the refresh thread if needed, the lock must be held.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._closed = False
+            self._thread = threading.Thread(target=self._refresh, name="ChatActionManager", daemon=True)
+            self._thread.start()
+
+    def _refresh(self):
+        """
+        Private method that sends the due actions until closed.
+        """
+        while True:
+            with self._condition:
+                if self._closed:
+                    return
+
+                now = time.monotonic()
+                due = [(chat_id, entry[0]) for chat_id, entry in self._active.items()
+                       if entry[2] is None or now - entry[2] >= self._interval]
+                for chat_id, _ in due:
+                    self._active[chat_id][2] = now
+
+                if not due:
+                    next_sends = [entry[2] + self._interval for entry in self._active.values()]
+                    self._condition.wait(min(next_sends) - now if next_sends else None)
+                    continue
+
+            for chat_id, action in due:  # Sent without the lock, so listeners are never blocked
+                try:
+                    self._api.sendChatAction(chat_id, action)
+                except (requests.RequestException, ValueError):  # ValueError if the reply is not JSON
+                    pass
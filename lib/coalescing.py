@@ -0,0 +1,183 @@
+import threading
+import time
+
+import requests
+
+
+class MessageCoalescer(object):
+    """
+    Merge consecutive plain text messages sent to the same chat within a window into one message, saving round trips
+    and per-chat rate limit. You can simply use it in this way:
+
+        api.coalescer = MessageCoalescer(api)
+
+    Messages with reply_markup or reply_to_message_id are never merged: they are sent immediately, after the text
+    already waiting for their chat, so the order of the messages of a chat is kept. While enabled, sendMessage returns
+    None for the delayed messages, and the ones lost because of a network error or a reply that is not JSON are counted
+    in failed and printed in debug mode; use a DurableOutbox as well in order to retry them.
+    """
+
+    MAX_LENGTH = 4096  # Maximum length of the text of a message
+
+    def __init__(self, api, window=0.05, max_length=MAX_LENGTH, separator="\n"):
+        """
+        :param api: TelegramBotAPI, Client used in order to send the messages.
+        :param window: Float, Optional. Seconds a message waits for the next ones of the same chat.
+        :param max_length: Integer, Optional. Maximum length of a merged text.
+        :param separator: String, Optional. String put between merged texts.
+        """
+        self._api = api
+        self._window = window
+        self._max_length = max_length
+        self._separator = separator
+        self._pending = dict()  # chat id -> [data, list of texts, length, deadline]
+        self._condition = threading.Condition()
+        self._send_lock = threading.RLock()  # Sends are serialized in order to keep the order of each chat
+        self._thread = None
+        self._closed = False
+        self._merged = 0
+        self._failed = 0
+
+    @property
+    def merged(self):
+        """
+        Number of messages saved merging them into others.
+        """
+        return self._merged
+
+    @property
+    def failed(self):
+        """
+        Number of delayed messages not sent because of a network error or a reply that is not JSON, printed in debug
+        mode.
+        """
+        return self._failed
+
+    def send(self, data):
+        """
+        Send a message or delay it in order to merge it with the next ones.
+        :param data: Dict, Parameters of sendMessage.
+        :return: The response of the server, None if the message is delayed.
+        """
+        chat_id = data["chat_id"]
+
+        if data.get("reply_markup") is not None or data.get("reply_to_message_id") is not None or \
+                len(data["text"]) > self._max_length:
+            with self._send_lock:
+                self.flush(chat_id)
+                return self._api._send_message(data)
+
+        with self._condition:
+            if self._merge(data):
+                return None
+            if chat_id not in self._pending:
+                self._wait(data)
+                return None
+
+        # Not mergeable with the text waiting: it is popped and sent holding the send lock, so the flushing thread can
+        # not send the new one first
+        with self._send_lock:
+            with self._condition:
+                if self._merge(data):  # The waiting text was flushed meanwhile and another one arrived
+                    return None
+                full = self._pending.pop(chat_id, None)
+                self._wait(data)
+
+            if full is not None:
+                self._send(full)
+        return None
+
+    def _merge(self, data):
+        """
+        Private method that appends a message to the text waiting for its chat if possible, the lock must be held.
+        :return: True if merged.
+        """
+        pending = self._pending.get(data["chat_id"])
+        if pending is not None and \
+                pending[0].get("disable_web_page_preview") == data.get("disable_web_page_preview") and \
+                pending[2] + len(self._separator) + len(data["text"]) <= self._max_length:
+            pending[1].append(data["text"])
+            pending[2] += len(self._separator) + len(data["text"])
+            self._merged += 1
+            return True
+        return False
+
+    def _wait(self, data):
+        """
+        Private method that makes a message the text waiting for its chat, the lock must be held.
+        """
+        self._pending[data["chat_id"]] = [data, [data["text"]], len(data["text"]), time.monotonic() + self._window]
+        self._ensure_thread()
+        self._condition.notify()
+
+    def flush(self, chat_id=None):
+        """
+        Send immediately the messages waiting for a chat or, by default, for all chats.
+        :param chat_id: Integer, Optional. Unique identifier for the target chat.
+        """
+        with self._condition:
+            if chat_id is None:
+                flushed = list(self._pending.values())
+                self._pending.clear()
+            else:
+                pending = self._pending.pop(chat_id, None)
+                flushed = [] if pending is None else [pending]
+
+        for pending in flushed:
+            self._send(pending)
+
+    def close(self):
+        """
+        Send all the waiting messages and stop the flushing thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self.flush()
+
+    def _send(self, pending):
+        """
+        Private method that sends a merged message.
+        """
+        data = dict(pending[0])
+        data["text"] = self._separator.join(pending[1])
+        with self._send_lock:
+            try:
+                self._api._send_message(data)
+            except (requests.RequestException, ValueError) as e:  # ValueError if the reply is not JSON, e.g. a 502 page
+                self._failed += 1
+                if self._api.debug:
+                    print(e)
+
+    def _ensure_thread(self):
+        """
+        Private method that starts the flushing thread if needed, the lock must be held.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._closed = False
+            self._thread = threading.Thread(target=self._flush_expired, name="MessageCoalescer", daemon=True)
+            self._thread.start()
+
+    def _flush_expired(self):
+        """
+        Private method that sends the messages whose window is expired until closed.
+        """
+        while True:
+            with self._condition:
+                if self._closed:
+                    return
+
+                now = time.monotonic()
+                deadlines = [pending[3] for pending in self._pending.values()]
+                if not deadlines or min(deadlines) > now:
+                    self._condition.wait(min(deadlines) - now if deadlines else None)
+                    continue
+
+            with self._send_lock:  # Taken before popping, so a flush of the same chat can not overtake them
+                with self._condition:
+                    now = time.monotonic()
+                    expired = [chat_id for chat_id, pending in self._pending.items() if pending[3] <= now]
+                    expired = [self._pending.pop(chat_id) for chat_id in expired]
+
+                for pending in expired:
+                    self._send(pending)
@@ -0,0 +1,77 @@
+class UpdateDeduplicator(object):
+    """
+    Drop updates already seen, useful with webhooks, retries and restarts since the same update_id can be delivered
+    more than once. You can simply use it in this way:
+
+        api.deduplicator = UpdateDeduplicator()
+
+    Seen identifiers are kept in a sliding bitmap relative to the highest one, so memory is bounded by window bits and
+    every check is a shift and a mask. Identifiers older than the window can not be checked anymore and are dropped.
+    """
+
+    def __init__(self, window=4096):
+        """
+        :param window: Integer, Optional. Number of identifiers, below the highest seen, that are tracked.
+        """
+        self._window = window
+        self._mask = (1 << window) - 1
+        self._top = None  # Highest update_id seen, bit i of _bits is update_id _top - i
+        self._bits = 0
+        self._accepted = 0
+        self._duplicates = 0
+        self._expired = 0
+
+    @property
+    def accepted(self):
+        """
+        Number of accepted updates.
+        """
+        return self._accepted
+
+    @property
+    def duplicates(self):
+        """
+        Number of dropped updates because already seen.
+        """
+        return self._duplicates
+
+    @property
+    def expired(self):
+        """
+        Number of dropped updates because older than the window.
+        """
+        return self._expired
+
+    def accept(self, update_id):
+        """
+        Mark an update as seen.
+        :param update_id: Integer, The update‘s unique identifier.
+        :return: True if it is the first time the update is seen, False if it has to be dropped.
+        """
+        if self._top is None or update_id > self._top:
+            shift = self._window if self._top is None else update_id - self._top
+            self._bits = ((self._bits << shift) | 1) & self._mask if shift < self._window else 1
+            self._top = update_id
+            self._accepted += 1
+            return True
+
+        distance = self._top - update_id
+        if distance >= self._window:
+            self._expired += 1
+            return False
+
+        bit = 1 << distance
+        if self._bits & bit:
+            self._duplicates += 1
+            return False
+
+        self._bits |= bit
+        self._accepted += 1
+        return True
+
+    def reset(self):
+        """
+        Forget all the seen updates, counters are kept.
+        """
+        self._top = None
+        self._bits = 0
@@ -6,12 +6,33 @@ class MessageDispatcher(object):
 
     def __init__(self):
         self._events = dict()
+        self._state_events = dict()
+        self._state_store = None
+        self._filters = []
+        self._post_handlers = []
+        self._location_listener = None  # (listener, index, k, radius)
 
     def __del__(self):
         """
         Remove all listener references at destruction time.
         """
         self._events = None
+        self._state_events = None
+        self._filters = None
+        self._post_handlers = None
+        self._location_listener = None
+
+    @property
+    def state_store(self):
+        """
+        StateStore with the conversation state of every chat, used in order to route messages to the listeners
+        registered for a state. None if disabled.
+        """
+        return self._state_store
+
+    @state_store.setter
+    def state_store(self, value):
+        self._state_store = value
 
     def has_listener(self, listener):
         """
@@ -20,22 +41,94 @@ class MessageDispatcher(object):
         """
         return listener in self._events
 
+    def add_filter(self, message_filter):
+        """
+        Add a filter called, in order of addition, with every message before any listener. If a filter returns False
+        the message is dropped and the next filters are not called, so put the cheapest ones first.
+        :param message_filter: Function, Function that takes a Message and returns a Boolean, see middleware.Filter.
+        """
+        self._filters.append(message_filter)
+
+    def remove_filter(self, message_filter):
+        """
+        Remove a filter.
+        :param message_filter: Function, Filter to remove.
+        """
+        self._filters.remove(message_filter)
+
+    def add_post_handler(self, handler):
+        """
+        Add a handler called, in order of addition, with every message that passed the filters after the listener.
+        :param handler: Function, Function that takes the Message and a Boolean, True if a listener was called.
+        """
+        self._post_handlers.append(handler)
+
+    def remove_post_handler(self, handler):
+        """
+        Remove a post handler.
+        :param handler: Function, Handler to remove.
+        """
+        self._post_handlers.remove(handler)
+
     def dispatch_message(self, message):
         """
-        Dispatch message to right function watching the text attribute.
+        Pass message through the filters, route it and then pass it to the post handlers.
+        :param message: Message, Message to dispatch.
+        """
+        for message_filter in self._filters:
+            if not message_filter(message):
+                return
+
+        handled = self.route_message(message)
+
+        for handler in self._post_handlers:
+            handler(message, handled)
+
+    def route_message(self, message):
+        """
+        Dispatch message to right function watching the text attribute and, if there is a state store, the state of
+        the chat. Listeners registered for the state of the chat come before the ones without state. Location messages
+        go to the location listener, if any.
         :param message: Message, Message to dispatch.
+        :return: True if a listener was called, False otherwise.
         """
+        if self._location_listener is not None and message.location is not None:
+            listener, index, k, radius = self._location_listener
+            if index is None:
+                listener(message)
+            else:
+                location = message.location
+                if k is not None:
+                    listener(message, index.nearest(location.latitude, location.longitude, k, radius))
+                else:
+                    listener(message, index.within(location.latitude, location.longitude, radius))
+            return True
+
+        if self._state_store is not None and self._state_events:
+            state = self._state_store.get(message.chat.id)
+            if state is not None:
+                listener = self._state_events.get((state, message.text)) or self._state_events.get((state, None))
+                if listener is not None:
+                    listener(message)
+                    return True
+
         if message.text in self._events.keys():
             listener = self._events[message.text]
             listener(message)
+            return True
 
-    def add_message_listener(self, word, listener):
+        return False
+
+    def add_message_listener(self, word, listener, state=None):
         """
         Add a message listener for a word.
-        :param word: String, Word which the MessageDispatcher has to check.
+        :param word: String, Word which the MessageDispatcher has to check. If None and state is given, any text.
         :param listener: Function, Function that MessageDispatcher has to call when word comes.
+        :param state: Object, Optional. State in which the chat has to be in order to call the listener.
         """
-        if not self.has_listener(listener):
+        if state is not None:
+            self._state_events.update({(state, word): listener})
+        elif not self.has_listener(listener):
             self._events.update({word: listener})
 
     def remove_message_listener(self, listener):
@@ -46,19 +139,66 @@ class MessageDispatcher(object):
         if self.has_listener(listener):
             del self._events[listener]
 
-    def respond_to(self, word):
+    def respond_to(self, word, state=None):
         """
         A decorator useful in order to add listener for a message.
         Example:
             @api.respond_to("Hello")
             def respond(message):
                 api.sendMessage(message.chat.id, "Hi!")
+                api.state_store.set(message.chat.id, "greeted")
+
+            @api.respond_to(None, state="greeted")
+            def respond_again(message):
+                api.sendMessage(message.chat.id, "Hi again!")
+
+        :param word: String, Word. If None and state is given, any text.
+        :param state: Object, Optional. State in which the chat has to be, see state_store.
+        """
+
+        def decorator(function):
+            self.add_message_listener(word, function, state)
+            return function
+
+        return decorator
+
+    def add_location_listener(self, listener, index=None, k=None, radius=None):
+        """
+        Set the listener of the Location messages, replacing the previous one.
+        :param listener: Function, Function called with the message or, if index is given, with the message and the
+            results of the query, an Array of (distance in meters, key, item) nearest first.
+        :param index: GeoIndex, Optional. Index queried around the location.
+        :param k: Integer, Optional. Number of nearest points to query, by default all the points within radius.
+        :param radius: Float, Optional. Maximum distance in meters, required without k.
+        """
+        if index is not None and k is None and radius is None:
+            raise ValueError("k or radius is required with an index")
+        self._location_listener = (listener, index, k, radius)
+
+    def remove_location_listener(self):
+        """
+        Remove the listener of the Location messages.
+        """
+        self._location_listener = None
+
+    def respond_to_location(self, index=None, k=None, radius=None):
+        """
+        A decorator useful in order to add the listener of the Location messages.
+        Example:
+            drivers = GeoIndex()
+
+            @api.respond_to_location(drivers, k=3, radius=5000)
+            def respond(message, nearest):
+                text = "\n".join("%s at %d m" % (key, distance) for distance, key, _ in nearest)
+                api.sendMessage(message.chat.id, text or "No drivers nearby")
 
-        :param word: String, Word.
+        :param index: GeoIndex, Optional. Index queried around the location.
+        :param k: Integer, Optional. Number of nearest points to query, by default all the points within radius.
+        :param radius: Float, Optional. Maximum distance in meters, required without k.
         """
 
         def decorator(function):
-            self.add_message_listener(word, function)
+            self.add_location_listener(function, index, k, radius)
             return function
 
-        return decorator
\ No newline at end of file
+        return decorator
@@ -0,0 +1,312 @@
+import json
+import os
+import threading
+import time
+
+from lib.lazy import decode_update
+
+
+class QueueBackend(object):
+    """
+    Father class for all queues between an UpdateProducer and the UpdateConsumers. Updates are published in
+    partitions by key, and each partition is consumed in order, so the updates with the same key keep their order.
+    """
+
+    @property
+    def partitions(self):
+        """
+        Number of partitions.
+        """
+        raise NotImplementedError
+
+    def partition_for(self, key):
+        """
+        Return the partition of a key.
+        :param key: Integer, Key of the update, the chat id.
+        """
+        return key % self.partitions
+
+    def publish(self, key, payload):
+        """
+        Append a payload to the partition of its key.
+        :param key: Integer, Key of the update, the chat id.
+        :param payload: Bytes, Payload to publish.
+        """
+        raise NotImplementedError
+
+    def consume(self, partition, max_count=100):
+        """
+        Return the next payloads of a partition after the committed position.
+        :param partition: Integer, Partition to read.
+        :param max_count: Integer, Optional. Maximum number of payloads.
+        :return: An Array of (position, payload), position is the one to commit after processing the payload.
+        """
+        raise NotImplementedError
+
+    def commit(self, partition, position):
+        """
+        Mark the payloads of a partition up to position as processed.
+        :param partition: Integer, Partition.
+        :param position: Object, Position returned by consume.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Release all the resources of the backend.
+        """
+        pass
+
+
+class FileQueueBackend(QueueBackend):
+    """
+    Queue backed by a directory, one append-only file of JSON lines for each partition and one file with the committed
+    byte position of each partition. Useful on a shared volume or in tests in place of a broker.
+    """
+
+    def __init__(self, directory, partitions=8, fsync=False):
+        """
+        :param directory: String, Directory of the queue, created if missing.
+        :param partitions: Integer, Optional. Number of partitions, the same for producer and consumers.
+        :param fsync: Boolean, Optional. If True every publish is flushed to disk.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._partitions = partitions
+        self._fsync = fsync
+        self._writers = dict()  # partition -> file opened for append
+        self._positions = dict()  # partition -> committed position, read from the file only once
+
+    @property
+    def partitions(self):
+        return self._partitions
+
+    def _path(self, partition, extension):
+        """
+        Private method that returns the path of a file of a partition.
+        """
+        return os.path.join(self._directory, "partition-%04d.%s" % (partition, extension))
+
+    def publish(self, key, payload):
+        partition = self.partition_for(key)
+        writer = self._writers.get(partition)
+        if writer is None:
+            writer = self._writers[partition] = open(self._path(partition, "log"), "ab")
+
+        writer.write(payload.replace(b"\n", b" ") + b"\n")  # JSON has no raw new lines, one payload per line
+        writer.flush()
+        if self._fsync:
+            os.fsync(writer.fileno())
+
+    def consume(self, partition, max_count=100):
+        position = self._positions.get(partition)
+        if position is None:
+            position = self._committed(partition)
+
+        records = []  # The position is moved only by commit, so the records not committed are returned again
+        try:
+            with open(self._path(partition, "log"), "rb") as f:
+                f.seek(position)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Still being written
+                    position += len(line)
+                    records.append((position, line[:-1]))
+                    if len(records) >= max_count:
+                        break
+        except FileNotFoundError:
+            pass
+        return records
+
+    def commit(self, partition, position):
+        temporary = self._path(partition, "offset.tmp")
+        with open(temporary, "w") as f:
+            f.write(str(position))
+        os.replace(temporary, self._path(partition, "offset"))
+        self._positions[partition] = position
+
+    def _committed(self, partition):
+        """
+        Private method that returns the committed position of a partition.
+        """
+        try:
+            with open(self._path(partition, "offset")) as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+
+class UpdateProducer(object):
+    """
+    The only node that polls getUpdates: it publishes every update to a QueueBackend keyed by chat id, so many
+    UpdateConsumer can process them. You can simply use it in this way:
+
+        producer = UpdateProducer(TelegramBotAPI(TOKEN), FileQueueBackend("queue"))
+        producer.run()
+
+    The offset is moved only after an update is published, so no update is lost if the producer crashes.
+    """
+
+    def __init__(self, api, backend):
+        """
+        :param api: TelegramBotAPI, Client used in order to poll the updates.
+        :param backend: QueueBackend, Queue where the updates are published.
+        """
+        self._api = api
+        self._backend = backend
+        self._running = threading.Event()
+        self._published = 0
+        api.lazy_updates = True  # Updates are published as received, without building them
+
+    @property
+    def published(self):
+        """
+        Number of published updates.
+        """
+        return self._published
+
+    def publish(self, updates):
+        """
+        Publish a batch of updates received with getUpdates of the lazy client. Updates of webhooks are published with
+        publish_webhook, since a Message built by Jsonable.from_text has no raw JSON.
+        :param updates: Array of Update, Updates with LazyMessage, or without message.
+        """
+        for update in updates:
+            message = update.message
+            raw = {"update_id": update.update_id}
+            if message is not None:
+                raw["message"] = message.raw
+            key = message.chat_id if message is not None else 0
+            self._backend.publish(key, json.dumps(raw).encode("utf-8"))
+            self._published += 1
+            self._api.offset = max(self._api.offset, update.update_id + 1)
+
+    def publish_webhook(self, body):
+        """
+        Publish an update received through a webhook, e.g. by a node that serves webhooks instead of polling.
+        :param body: String or Bytes, JSON-serialized Update, the body of the webhook request.
+        """
+        self.publish([decode_update(json.loads(body))])
+
+    def run(self):
+        """
+        This method starts polling and publishing until stop is called.
+        """
+        self._running.set()
+        try:
+            while self._running.is_set():
+                self.publish(self._api.getUpdates())
+        finally:
+            self._api.commit_offset()
+
+    def stop(self):
+        """
+        Stop polling after the current batch.
+        """
+        self._running.clear()
+
+
+class UpdateConsumer(object):
+    """
+    Node that dispatches the updates published by an UpdateProducer. Every partition must be consumed by only one
+    consumer, so the updates of a chat are dispatched in order. You can simply use it in this way:
+
+        api = TelegramBotAPI(TOKEN)  # Used only in order to dispatch and to send, never polls
+        consumer = UpdateConsumer(api, FileQueueBackend("queue"), node=0, nodes=4)
+        consumer.run()
+    """
+
+    def __init__(self, dispatcher, backend, node=0, nodes=1, poll_interval=0.1):
+        """
+        :param dispatcher: MessageDispatcher, Dispatcher of the updates, a TelegramBotAPI is passed all the update.
+        :param backend: QueueBackend, Queue where the updates are published.
+        :param node: Integer, Optional. Index of this consumer, between 0 and nodes - 1.
+        :param nodes: Integer, Optional. Number of consumers, partitions are split between them.
+        :param poll_interval: Float, Optional. Seconds to wait when there are no updates.
+        """
+        self._dispatcher = dispatcher
+        self._backend = backend
+        self._partitions = [partition for partition in range(backend.partitions) if partition % nodes == node]
+        self._poll_interval = poll_interval
+        self._running = threading.Event()
+        self._consumed = 0
+        self._failed = 0
+
+    @property
+    def partitions(self):
+        """
+        Partitions consumed by this node.
+        """
+        return list(self._partitions)
+
+    @property
+    def consumed(self):
+        """
+        Number of dispatched updates.
+        """
+        return self._consumed
+
+    @property
+    def failed(self):
+        """
+        Number of dispatches that raised, each retried at the next consume_once.
+        """
+        return self._failed
+
+    def consume_once(self, max_count=100):
+        """
+        Dispatch the waiting updates of all the partitions of this node, committing each partition after its batch. If
+        the dispatch of an update raises, its partition is committed up to the update before and left until the next
+        call, when the update is dispatched again, while the other partitions go on. A payload that cannot be decoded
+        is skipped, since it would fail in the same way every time.
+        :param max_count: Integer, Optional. Maximum number of updates of each partition.
+        :return: Number of dispatched updates.
+        """
+        consumed = 0
+        for partition in self._partitions:
+            committed = None
+            for position, payload in self._backend.consume(partition, max_count):
+                try:
+                    update = decode_update(json.loads(payload))
+                except (ValueError, KeyError):
+                    committed = position  # Skip it
+                    continue
+
+                try:
+                    if hasattr(self._dispatcher, "process_updates"):
+                        self._dispatcher.process_updates([update])
+                    elif update.message is not None:
+                        self._dispatcher.dispatch_message(update.message)
+                except Exception as e:
+                    self._failed += 1
+                    if getattr(self._dispatcher, "debug", False):  # If in debug mode, print the error and go on
+                        print(e)
+                    break
+                committed = position
+                consumed += 1
+
+            if committed is not None:
+                self._backend.commit(partition, committed)
+
+        self._consumed += consumed
+        return consumed
+
+    def run(self):
+        """
+        This method starts consuming until stop is called. Updates whose dispatch raises are retried, see consume_once.
+        """
+        self._running.set()
+        while self._running.is_set():
+            if not self.consume_once():
+                time.sleep(self._poll_interval)
+
+    def stop(self):
+        """
+        Stop consuming after the current batch.
+        """
+        self._running.clear()
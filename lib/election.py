@@ -0,0 +1,210 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+
+
+class LeaseBackend(object):
+    """
+    Father class for all the stores of the polling lease. The lease has an owner and an expiry time, and carries the
+    last committed offset, so a new leader goes on from where the old one stopped.
+    """
+
+    def acquire(self, owner, ttl):
+        """
+        Acquire the lease if free or expired, or renew it if already owned.
+        :param owner: String, Identifier of the instance.
+        :param ttl: Float, Seconds the lease lasts without renewals.
+        :return: True if owner holds the lease.
+        """
+        raise NotImplementedError
+
+    def release(self, owner):
+        """
+        Release the lease if owned, so a standby takes over immediately.
+        :param owner: String, Identifier of the instance.
+        """
+        raise NotImplementedError
+
+    def load_offset(self):
+        """
+        Return the last offset stored by a leader, 0 if none.
+        """
+        raise NotImplementedError
+
+    def store_offset(self, owner, offset):
+        """
+        Store the offset if owner still holds the lease.
+        :param owner: String, Identifier of the instance.
+        :param offset: Integer, Offset to store.
+        :return: True if stored, False if the lease was lost.
+        """
+        raise NotImplementedError
+
+
+class FileLeaseBackend(LeaseBackend):
+    """
+    Lease kept in a JSON file, every operation holds an exclusive lock on path + ".lock". Useful for instances on the
+    same machine or on a shared volume, and in tests.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: String, Path of the lease file.
+        """
+        self._path = path
+        self._lock_path = path + ".lock"
+
+    def _update(self, function):
+        """
+        Private method that reads the lease, applies function to it and writes it back, holding the lock.
+        :param function: Function, Function that takes the lease as dict and returns (result, changed).
+        """
+        with open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self._path) as f:
+                        lease = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    lease = {"owner": None, "expires": 0, "offset": 0}
+
+                result, changed = function(lease)
+                if changed:
+                    temporary = self._path + ".tmp"
+                    with open(temporary, "w") as f:
+                        json.dump(lease, f)
+                    os.replace(temporary, self._path)
+                return result
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def acquire(self, owner, ttl):
+        def acquire(lease):
+            now = time.time()
+            if lease["owner"] != owner and lease["owner"] is not None and lease["expires"] > now:
+                return False, False
+            lease["owner"] = owner
+            lease["expires"] = now + ttl
+            return True, True
+
+        return self._update(acquire)
+
+    def release(self, owner):
+        def release(lease):
+            if lease["owner"] != owner:
+                return None, False
+            lease["owner"] = None
+            lease["expires"] = 0
+            return None, True
+
+        self._update(release)
+
+    def load_offset(self):
+        return self._update(lambda lease: (lease["offset"], False))
+
+    def store_offset(self, owner, offset):
+        def store(lease):
+            if lease["owner"] != owner or lease["expires"] <= time.time():
+                return False, False
+            lease["offset"] = max(lease["offset"], offset)
+            return True, True
+
+        return self._update(store)
+
+
+class LeaderElection(object):
+    """
+    Leader election mode of TelegramBotAPI.run, useful in order to run hot-standby copies of a bot without conflicts on
+    getUpdates. You can simply use it in this way:
+
+        api.election = LeaderElection(FileLeaseBackend("/var/run/bot.lease"), ttl=10)
+        api.run()
+
+    Only the instance holding the lease polls, renewing it at every poll, while the others check it every
+    retry_interval seconds. If the leader dies, a standby takes over within ttl + retry_interval seconds, starting from
+    the offset stored by the leader. Long polling is capped to a third of ttl, and while a batch is dispatched the lease
+    is renewed, and the offset stored, every third of ttl by a heartbeat thread, so slow listeners do not lose it. If
+    the lease is lost anyway, e.g. because the process was suspended, the rest of the batch is left to the new leader.
+    """
+
+    def __init__(self, backend, ttl=10.0, retry_interval=1.0, owner=None):
+        """
+        :param backend: LeaseBackend, Store of the lease.
+        :param ttl: Float, Optional. Seconds the lease lasts without renewals.
+        :param retry_interval: Float, Optional. Seconds between two attempts of a standby.
+        :param owner: String, Optional. Identifier of this instance, by default a random one.
+        """
+        self._backend = backend
+        self._ttl = ttl
+        self._retry_interval = retry_interval
+        self._owner = owner if owner is not None else uuid.uuid4().hex
+        self._leader = False
+
+    @property
+    def owner(self):
+        """
+        Identifier of this instance.
+        """
+        return self._owner
+
+    @property
+    def leader(self):
+        """
+        True if this instance holds the lease.
+        """
+        return self._leader
+
+    def poll(self, api):
+        """
+        Poll and dispatch one batch of updates if leader, otherwise wait retry_interval.
+        :param api: TelegramBotAPI, Client to poll.
+        """
+        if not self._backend.acquire(self._owner, self._ttl):
+            self._leader = False
+            time.sleep(self._retry_interval)
+            return
+
+        if not self._leader:  # Just elected, go on from the offset of the previous leader
+            self._leader = True
+            api.offset = max(api.offset, self._backend.load_offset())
+
+        timeout = min(api.timeout, int(self._ttl / 3))
+        updates = api.getUpdates(timeout=timeout)
+
+        done = threading.Event()
+        lost = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(api, done, lost), name="LeaderElection-heartbeat",
+                                     daemon=True)
+        heartbeat.start()
+        try:
+            api.process_updates(updates, abort=lost)
+        finally:
+            done.set()
+            heartbeat.join()
+
+        if lost.is_set() or not self._backend.store_offset(self._owner, api.offset):
+            self._leader = False  # Lease lost while processing
+
+    def _heartbeat(self, api, done, lost):
+        """
+        Private method that renews the lease and stores the offset every third of ttl until done, setting lost if the
+        lease is lost.
+        """
+        while not done.wait(self._ttl / 3):
+            if not self._backend.acquire(self._owner, self._ttl) or \
+                    not self._backend.store_offset(self._owner, api.offset):
+                lost.set()
+                return
+
+    def release(self, api):
+        """
+        Store the offset and release the lease, if leader.
+        :param api: TelegramBotAPI, Client that polled.
+        """
+        if self._leader:
+            self._backend.store_offset(self._owner, api.offset)
+            self._backend.release(self._owner)
+            self._leader = False
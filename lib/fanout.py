@@ -0,0 +1,131 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+
+class RateLimiter(object):
+    """
+    Token bucket shared by threads: at most rate acquisitions per second on average, with bursts of burst.
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        :param rate: Float, Acquisitions per second.
+        :param burst: Integer, Optional. Acquisitions allowed at once after a pause.
+        """
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Wait until an acquisition is allowed.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self._rate
+            time.sleep(delay)
+
+
+class ForwardFanOut(object):
+    """
+    Forward a message to many chats concurrently, e.g. in order to mirror the posts of a channel. You can simply use it
+    in this way:
+
+        fan_out = ForwardFanOut(api, workers=8)
+
+
+        @api.respond_to("/broadcast")
+        def broadcast(message):
+            post = message.reply_to_message
+            for chat_id, response, error in fan_out.forward(message.chat.id, post.message_id, subscribers):
+                if error is not None or not response.get("ok"):
+                    print("Not forwarded to", chat_id)
+
+    Requests are sent by workers threads over the pooled keep-alive connections of the session of the client, so the
+    time to mirror a post depends on the number of targets divided by workers, up to the rate limits: at most rate
+    requests per second overall and one request every chat_interval seconds to the same chat. Use a session whose pool
+    holds at least workers connections, the default of requests holds 10. Requests refused with 429 or 5xx are retried
+    up to retries times, after the retry_after given by the server if any.
+    """
+
+    RETRY_DELAY = 1.0  # Seconds before retrying a request, when the server does not tell
+
+    def __init__(self, api, workers=8, rate=30.0, chat_interval=1.0, retries=3):
+        """
+        :param api: TelegramBotAPI, Client used in order to forward the messages.
+        :param workers: Integer, Optional. Number of concurrent requests.
+        :param rate: Float, Optional. Maximum requests per second overall, Telegram allows about 30.
+        :param chat_interval: Float, Optional. Minimum seconds between two requests to the same chat.
+        :param retries: Integer, Optional. Maximum attempts after the first one for each target.
+        """
+        self._api = api
+        self._workers = workers
+        self._limiter = RateLimiter(rate, burst=workers)
+        self._chat_interval = chat_interval
+        self._retries = retries
+        self._next_send = dict()  # chat id -> monotonic time from which it can receive again
+        self._lock = threading.Lock()
+
+    def forward(self, from_chat_id, message_id, chat_ids):
+        """
+        Forward a message to many chats, returning the results as soon as they come. Closing the generator early
+        cancels the requests not started yet.
+        :param from_chat_id: Integer, Unique identifier for the chat where the original message was sent.
+        :param message_id: Integer, Unique message identifier.
+        :param chat_ids: Iterable of Integer, Unique identifiers of the target chats.
+        :return: Generator of (chat id, response of the server or None, exception or None), in order of completion.
+        """
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            futures = {executor.submit(self._forward, chat_id, from_chat_id, message_id): chat_id
+                       for chat_id in chat_ids}
+            try:
+                for future in as_completed(futures):
+                    try:
+                        yield futures[future], future.result(), None
+                    except (requests.RequestException, ValueError) as e:
+                        yield futures[future], None, e
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def _wait_chat(self, chat_id):
+        """
+        Private method that waits until a chat can receive again and books the next slot.
+        """
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_send.get(chat_id, 0))
+            self._next_send[chat_id] = start + self._chat_interval
+            if len(self._next_send) > 4 * self._workers:  # Forget the chats that can already receive again
+                self._next_send = {key: value for key, value in self._next_send.items() if value > now}
+        if start > now:
+            time.sleep(start - now)
+
+    def _forward(self, chat_id, from_chat_id, message_id):
+        """
+        Private method that forwards the message to a chat, honouring the rate limits and retrying.
+        """
+        attempt = 0
+        while True:
+            self._wait_chat(chat_id)
+            self._limiter.acquire()
+            response = self._api.forwardMessage(chat_id, from_chat_id, message_id)
+
+            error_code = response.get("error_code") or 0
+            if response.get("ok") or not (error_code == 429 or error_code >= 500) or attempt >= self._retries:
+                return response
+
+            attempt += 1
+            retry_after = (response.get("parameters") or {}).get("retry_after", self.RETRY_DELAY)
+            time.sleep(retry_after)
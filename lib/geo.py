@@ -0,0 +1,211 @@
+import heapq
+import math
+import threading
+
+EARTH_RADIUS = 6371008.8  # Mean radius in meters
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+
+def haversine(latitude1, longitude1, latitude2, longitude2):
+    """
+    Return the great-circle distance in meters between two points.
+    :param latitude1: Float, Latitude of the first point in degrees.
+    :param longitude1: Float, Longitude of the first point in degrees.
+    :param latitude2: Float, Latitude of the second point in degrees.
+    :param longitude2: Float, Longitude of the second point in degrees.
+    """
+    phi1 = math.radians(latitude1)
+    phi2 = math.radians(latitude2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(longitude2 - longitude1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoIndex(object):
+    """
+    In-memory spatial index of points, e.g. drivers or points of interest. You can simply use it in this way:
+
+        drivers = GeoIndex()
+        drivers.insert("driver-1", 45.4642, 9.1900)
+        drivers.nearest(45.4700, 9.1800, k=3)
+
+    Points are kept in a grid of cell_size degrees, so a query reads only the cells around the point instead of
+    scanning all of them. Inserting a key again moves its point. With the default cells of about 1 km, queries of a
+    few kilometers on tens of thousands of points take well under a millisecond.
+    """
+
+    def __init__(self, cell_size=0.01):
+        """
+        :param cell_size: Float, Optional. Side of the cells in degrees, about the radius of the usual queries.
+        """
+        self._cell_size = cell_size
+        self._columns = int(math.ceil(360 / cell_size))
+        self._cells = dict()  # (row, column) -> {key: (latitude, longitude, item)}
+        self._points = dict()  # key -> (row, column)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """
+        Return the number of points.
+        """
+        return len(self._points)
+
+    def __contains__(self, key):
+        return key in self._points
+
+    def _cell(self, latitude, longitude):
+        """
+        Private method that returns the cell of a point.
+        """
+        return (int(math.floor((latitude + 90) / self._cell_size)),
+                int(math.floor((longitude + 180) / self._cell_size)) % self._columns)
+
+    def insert(self, key, latitude, longitude, item=None):
+        """
+        Add a point, or move it if the key is already in the index.
+        :param key: Object, Hashable identifier of the point.
+        :param latitude: Float, Latitude in degrees.
+        :param longitude: Float, Longitude in degrees.
+        :param item: Object, Optional. Data returned with the point by the queries.
+        """
+        cell = self._cell(latitude, longitude)
+        with self._lock:
+            old = self._points.get(key)
+            if old is not None and old != cell:
+                self._discard(key, old)
+            self._cells.setdefault(cell, dict())[key] = (latitude, longitude, item)
+            self._points[key] = cell
+
+    def remove(self, key):
+        """
+        Remove a point, if in the index.
+        :param key: Object, Identifier of the point.
+        :return: True if removed.
+        """
+        with self._lock:
+            cell = self._points.pop(key, None)
+            if cell is None:
+                return False
+            self._discard(key, cell)
+            return True
+
+    def _discard(self, key, cell):
+        """
+        Private method that removes a key from a cell, the lock must be held.
+        """
+        points = self._cells[cell]
+        del points[key]
+        if not points:
+            del self._cells[cell]
+
+    def get(self, key):
+        """
+        Return (latitude, longitude, item) of a point, None if missing.
+        :param key: Object, Identifier of the point.
+        """
+        with self._lock:
+            cell = self._points.get(key)
+            return None if cell is None else self._cells[cell][key]
+
+    def _ring(self, row, column, radius):
+        """
+        Private method that returns the cells at distance radius, in cells, from a cell. Rings wider than the grid wrap
+        around it, without repeating the cells of the previous rings.
+        """
+        if radius == 0:
+            return [(row, column)]
+        if 2 * radius + 1 >= self._columns:
+            columns = range(self._columns)
+        else:
+            columns = [c % self._columns for c in range(column - radius, column + radius + 1)]
+        sides = {(column - radius) % self._columns, (column + radius) % self._columns} \
+            if 2 * radius <= self._columns else ()
+
+        cells = [(row - radius, c) for c in columns] + [(row + radius, c) for c in columns]
+        for r in range(row - radius + 1, row + radius):
+            cells.extend((r, c) for c in sides)
+        return cells
+
+    def _cell_meters(self, latitude, rings):
+        """
+        Private method that returns the minimum width in meters of a cell within rings cells of a latitude, so no point
+        outside rings cells can be nearer than rings times it.
+        """
+        farthest = min(abs(latitude) + rings * self._cell_size, 90.0)
+        return self._cell_size * METERS_PER_DEGREE * math.cos(math.radians(farthest))
+
+    def nearest(self, latitude, longitude, k=1, max_distance=None):
+        """
+        Return the k points nearest to a location.
+        :param latitude: Float, Latitude in degrees.
+        :param longitude: Float, Longitude in degrees.
+        :param k: Integer, Optional. Maximum number of points.
+        :param max_distance: Float, Optional. Maximum distance in meters.
+        :return: Array of (distance in meters, key, item), nearest first.
+        """
+        row, column = self._cell(latitude, longitude)
+        best = []  # Heap of (-distance, order seen, key, item), the farthest on top
+        seen = 0
+        with self._lock:
+            rings = 0
+            while seen < len(self._points):
+                if (2 * rings + 1) ** 2 > 4 * len(self._cells):  # Sparse around the location, a scan is cheaper
+                    candidates = self._scan(latitude, longitude, max_distance)
+                    return heapq.nsmallest(k, candidates, key=lambda result: result[0])
+
+                for cell in self._ring(row, column, rings):
+                    for key, (point_latitude, point_longitude, item) in self._cells.get(cell, {}).items():
+                        seen += 1
+                        distance = haversine(latitude, longitude, point_latitude, point_longitude)
+                        if max_distance is not None and distance > max_distance:
+                            continue
+                        if len(best) < k:
+                            heapq.heappush(best, (-distance, seen, key, item))
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, (-distance, seen, key, item))
+
+                # The points not seen yet are at least rings cells away
+                bound = rings * self._cell_meters(latitude, rings + 1)
+                if max_distance is not None and bound > max_distance:
+                    break
+                if len(best) == k and bound >= -best[0][0]:
+                    break
+                rings += 1
+
+        return [(-distance, key, item) for distance, _, key, item in sorted(best, reverse=True)]
+
+    def _scan(self, latitude, longitude, max_distance=None, cells=None):
+        """
+        Private method that returns (distance, key, item) of the points of some cells, by default all, within
+        max_distance, the lock must be held.
+        """
+        results = []
+        for cell in self._cells if cells is None else cells:
+            for key, (point_latitude, point_longitude, item) in self._cells.get(cell, {}).items():
+                distance = haversine(latitude, longitude, point_latitude, point_longitude)
+                if max_distance is None or distance <= max_distance:
+                    results.append((distance, key, item))
+        return results
+
+    def within(self, latitude, longitude, radius):
+        """
+        Return all the points within a distance from a location.
+        :param latitude: Float, Latitude in degrees.
+        :param longitude: Float, Longitude in degrees.
+        :param radius: Float, Distance in meters.
+        :return: Array of (distance in meters, key, item), nearest first.
+        """
+        row, column = self._cell(latitude, longitude)
+        rows = int(math.ceil(radius / (self._cell_size * METERS_PER_DEGREE)))
+        width = self._cell_meters(latitude, rows + 1)  # Narrowest cell in the rows of the query
+        columns = min(int(math.ceil(radius / width)) if width > 0 else self._columns, self._columns // 2)
+        with self._lock:
+            if (2 * rows + 1) * min(2 * columns + 1, self._columns) > len(self._cells):
+                cells = None  # Large radius, every cell is a candidate
+            else:
+                cells = set((r, c % self._columns) for r in range(row - rows, row + rows + 1)
+                            for c in range(column - columns, column + columns + 1))
+            results = self._scan(latitude, longitude, radius, cells)
+
+        results.sort(key=lambda result: result[0])
+        return results
@@ -0,0 +1,144 @@
+import json
+from functools import lru_cache
+
+from lib.models import ReplyKeyboardMarkup
+
+
+class KeyboardRow(object):
+    """
+    Immutable row of buttons of a custom keyboard, its JSON is encoded once and shared by all the keyboards using it.
+    Use keyboard_row in order to reuse the same instance for the same buttons.
+    """
+
+    def __init__(self, *buttons):
+        """
+        :param buttons: String, Text of the buttons.
+        """
+        self._buttons = tuple(buttons)
+        self._json = json.dumps(self._buttons)
+
+    @property
+    def buttons(self):
+        """
+        Text of the buttons.
+        """
+        return self._buttons
+
+    @property
+    def json(self):
+        """
+        JSON of the row.
+        """
+        return self._json
+
+
+@lru_cache(maxsize=4096)
+def keyboard_row(*buttons):
+    """
+    Return a KeyboardRow, the same instance for the same buttons while cached.
+    :param buttons: String, Text of the buttons.
+    """
+    return KeyboardRow(*buttons)
+
+
+class KeyboardBuilder(object):
+    """
+    Immutable custom keyboard whose variants share the unchanged rows. Useful in order to build many personalized
+    keyboards quickly:
+
+        base = KeyboardBuilder([["Orders", "Help"], ["Settings"]], resize_keyboard=True)
+
+
+        @api.respond_to("/start")
+        def respond(message):
+            keyboard = base.with_row(1, ["Settings", message.message_from.first_name])
+            api.sendMessage(message.chat.id, "Choose", reply_markup=keyboard)
+
+    The reply_markup is assembled joining the cached JSON of the rows, so only the changed rows are encoded.
+    """
+
+    def __init__(self, rows=(), resize_keyboard=False, one_time_keyboard=False, selective=None):
+        """
+        :param rows: Array of KeyboardRow or of Array of String, Rows of buttons.
+        :param resize_keyboard: Boolean, Optional. Requests clients to resize the keyboard vertically for optimal fit.
+        :param one_time_keyboard: Boolean, Optional. Requests clients to hide the keyboard as soon as it's been used.
+        :param selective: Boolean, Optional. Use this parameter if you want to show the keyboard to specific users only.
+        """
+        self._rows = tuple(self._row(row) for row in rows)
+        self._resize_keyboard = resize_keyboard
+        self._one_time_keyboard = one_time_keyboard
+        self._selective = selective
+        self._options = json.dumps({"resize_keyboard": resize_keyboard, "one_time_keyboard": one_time_keyboard,
+                                    "selective": selective})[1:]  # Without the opening brace, spliced after keyboard
+        self._json = None
+
+    @staticmethod
+    def _row(row):
+        """
+        Private method that returns a row as KeyboardRow.
+        """
+        return row if isinstance(row, KeyboardRow) else keyboard_row(*row)
+
+    def _copy(self, rows):
+        """
+        Private method that returns a builder with other rows and the same options, sharing the options JSON.
+        """
+        builder = KeyboardBuilder.__new__(KeyboardBuilder)
+        builder.__dict__.update(self.__dict__)
+        builder._rows = rows
+        builder._json = None
+        return builder
+
+    def __len__(self):
+        """
+        Return the number of rows.
+        """
+        return len(self._rows)
+
+    @property
+    def rows(self):
+        """
+        Rows of the keyboard.
+        """
+        return self._rows
+
+    def with_row(self, index, row):
+        """
+        Return a keyboard equal to this one but with a row replaced.
+        :param index: Integer, Index of the row to replace.
+        :param row: KeyboardRow or Array of String, New row.
+        """
+        rows = list(self._rows)
+        rows[index] = self._row(row)
+        return self._copy(tuple(rows))
+
+    def append_row(self, row):
+        """
+        Return a keyboard equal to this one with a row added at the end.
+        :param row: KeyboardRow or Array of String, Row to add.
+        """
+        return self._copy(self._rows + (self._row(row),))
+
+    def without_row(self, index):
+        """
+        Return a keyboard equal to this one without a row.
+        :param index: Integer, Index of the row to remove.
+        """
+        rows = list(self._rows)
+        del rows[index]
+        return self._copy(tuple(rows))
+
+    def to_json(self):
+        """
+        Return the JSON-serialized ReplyKeyboardMarkup, as expected by the reply_markup of sendMessage.
+        """
+        if self._json is None:
+            self._json = '{"keyboard": [' + ", ".join(row.json for row in self._rows) + "], " + self._options
+        return self._json
+
+    def to_markup(self):
+        """
+        Return the keyboard as ReplyKeyboardMarkup.
+        """
+        return ReplyKeyboardMarkup([list(row.buttons) for row in self._rows], self._resize_keyboard,
+                                   self._one_time_keyboard, self._selective)
@@ -0,0 +1,125 @@
+import json
+
+from lib.models import as_json, APIError, Message, Update
+
+# Fields that tell the kind of a message, in order of precedence
+MESSAGE_KINDS = ("text", "audio", "document", "photo", "sticker", "video", "contact", "location",
+                 "new_chat_participant", "left_chat_participant", "new_chat_title", "new_chat_photo",
+                 "delete_chat_photo", "group_chat_created")
+
+
+def message_kind(message):
+    """
+    Return the kind of a message decoded with json.loads without object hook, one of MESSAGE_KINDS or None.
+    :param message: Dict, The decoded message.
+    """
+    for kind in MESSAGE_KINDS:
+        if kind in message:
+            return kind
+    return None
+
+
+def materialize(value):
+    """
+    Build the models of a decoded JSON value, like Jsonable.from_text does while decoding.
+    :param value: Object, Dict, list or scalar decoded with json.loads without object hook.
+    :return: The value with all dicts replaced by the right models.
+    """
+    if isinstance(value, dict):
+        value = dict(value)  # as_json changes the dict, the decoded JSON is kept as it is
+        for key, item in value.items():
+            if isinstance(item, (dict, list)):
+                value[key] = materialize(item)
+        return as_json(value)
+    if isinstance(value, list):
+        return [materialize(item) if isinstance(item, (dict, list)) else item for item in value]
+    return value
+
+
+def decode_updates(body, allowed_kinds=None):
+    """
+    Decode the raw body of a getUpdates response without building the messages: each Update has a LazyMessage that
+    reads the fields needed in order to route it straight from the decoded JSON.
+    :param body: Bytes, Raw body of the response, decoded without an intermediate str of the whole body.
+    :param allowed_kinds: Collection of String, Optional. Kinds of message to keep, see MESSAGE_KINDS. The updates
+        with other kinds are returned without message, so their offset is confirmed but nothing is built.
+    :return: An Array of Update objects.
+    :raise APIError: If the request failed, like getUpdates.
+    """
+    response = json.loads(body)
+    if not response.get("ok"):
+        raise APIError(response.get("error_code"), response.get("description"))
+
+    return [decode_update(update, allowed_kinds) for update in response.get("result", ())]
+
+
+def decode_update(update, allowed_kinds=None):
+    """
+    Return the Update, with a LazyMessage, of an update decoded with json.loads without object hook.
+    :param update: Dict, The decoded update.
+    :param allowed_kinds: Collection of String, Optional. Kinds of message to keep, see decode_updates.
+    """
+    message = update.get("message")
+    if message is None or (allowed_kinds is not None and message_kind(message) not in allowed_kinds):
+        return Update(update["update_id"])
+    return Update(update["update_id"], LazyMessage(message))
+
+
+class LazyMessage(Message):
+    """
+    Message built only when needed. message_id, date, text and chat_id are read from the decoded JSON, chat,
+    message_from and location build only their own object, and any other field builds the whole Message once.
+    """
+
+    _FIELDS = {"_message_id": "message_id", "_date": "date", "_text": "text"}
+    _OBJECTS = {"_chat": "chat", "_from": "from", "_location": "location"}
+    _TRANSIENT = Message._TRANSIENT + ("_raw",)
+
+    def __init__(self, raw):
+        """
+        :param raw: Dict, The message decoded with json.loads without object hook.
+        """
+        self._raw = raw
+
+    def __getattr__(self, name):
+        """
+        Called only for the private fields not built yet, builds and keeps them.
+        """
+        raw = self.__dict__.get("_raw")
+        if raw is None or not name.startswith("_"):
+            raise AttributeError(name)
+
+        if name in self._FIELDS:
+            value = raw.get(self._FIELDS[name])
+        elif name in self._OBJECTS:
+            value = materialize(raw.get(self._OBJECTS[name]))
+        else:
+            self.materialize()
+            if name not in self.__dict__:
+                raise AttributeError(name)
+            return self.__dict__[name]
+
+        self.__dict__[name] = value
+        return value
+
+    @property
+    def chat_id(self):
+        """
+        Unique identifier of the chat, without building it.
+        """
+        return self._raw["chat"]["id"]
+
+    @property
+    def raw(self):
+        """
+        The message decoded with json.loads without object hook.
+        """
+        return self._raw
+
+    def materialize(self):
+        """
+        Build all the fields of the message, keeping the ones already built.
+        """
+        message = materialize(self._raw)
+        for key, value in message.__dict__.items():
+            self.__dict__.setdefault(key, value)
@@ -0,0 +1,120 @@
+import functools
+import time
+from collections import OrderedDict
+
+from lib.middleware import ChatTypeFilter
+
+
+# Name of context -> function that extracts it from a message
+CONTEXTS = {"chat_type": ChatTypeFilter.chat_type,
+            "chat_id": lambda message: message.chat.id,
+            "user_id": lambda message: message.message_from.id}
+
+
+class ResponseCache(object):
+    """
+    LRU cache with TTL of the responses of a listener.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        """
+        :param maxsize: Integer, Optional. Maximum number of cached responses.
+        :param ttl: Float, Optional. Seconds a response is valid, by default forever.
+        """
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._entries = OrderedDict()  # key -> (response, expiry time)
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Return the cached response of a key, None if missing or expired.
+        :param key: Tuple, Key of the response.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+            del self._entries[key]
+            self._expirations += 1
+            entry = None
+
+        if entry is None:
+            self._misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return entry[0]
+
+    def put(self, key, response):
+        """
+        Cache the response of a key.
+        :param key: Tuple, Key of the response.
+        :param response: Dict, Parameters of sendMessage.
+        """
+        expires = None if self._ttl is None else time.monotonic() + self._ttl
+        self._entries[key] = (response, expires)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def clear(self):
+        """
+        Remove all the cached responses.
+        """
+        self._entries.clear()
+
+    def stats(self):
+        """
+        Return a dict with the counters of the cache.
+        """
+        return {"size": len(self._entries), "hits": self._hits, "misses": self._misses,
+                "evictions": self._evictions, "expirations": self._expirations}
+
+
+def cached_response(api, ttl=None, maxsize=1024, context=()):
+    """
+    Decorator of listeners that return their response instead of sending it. The response is cached by normalized text
+    and context, and sent with sendMessage, also on a hit, without calling the listener. Example:
+
+        @api.respond_to("/help")
+        @cached_response(api, ttl=3600, context=("chat_type",))
+        def respond(message):
+            return "Send /start in order to start."
+
+        respond.cache.stats()
+
+    :param api: TelegramBotAPI, Client used in order to send the responses.
+    :param ttl: Float, Optional. Seconds a response is valid, by default forever.
+    :param maxsize: Integer, Optional. Maximum number of cached responses.
+    :param context: Tuple, Optional. What else, beside the text, the response depends on: names among "chat_type",
+        "chat_id" and "user_id", or functions that take the Message.
+    """
+    extractors = [CONTEXTS[item] if isinstance(item, str) else item for item in context]
+
+    def decorator(function):
+        cache = ResponseCache(maxsize, ttl)
+
+        @functools.wraps(function)
+        def wrapper(message):
+            key = (message.features.normalized,) + tuple(extract(message) for extract in extractors)
+            response = cache.get(key)
+            if response is None:
+                response = function(message)
+                if response is None:  # Nothing to send, so nothing to cache
+                    return None
+                if isinstance(response, str):
+                    response = {"text": response}
+                cache.put(key, response)
+            return api.sendMessage(message.chat.id, **response)
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
@@ -0,0 +1,102 @@
+import time
+from collections import OrderedDict, deque
+
+from lib.models import User
+
+
+class Filter(object):
+    """
+    Father class for all filters added to a MessageDispatcher with add_filter. A filter is called with every message
+    before any listener and returns False in order to drop it. Any function with the same signature can be a filter.
+    """
+
+    def __call__(self, message):
+        """
+        :param message: Message, Message to check.
+        :return: True if the message has to be dispatched, False otherwise.
+        """
+        return True
+
+
+class ChatTypeFilter(Filter):
+    """
+    Filter that accepts only messages coming from some types of chat.
+    """
+
+    PRIVATE = "private"
+    GROUP = "group"
+
+    def __init__(self, *chat_types):
+        """
+        :param chat_types: String, Accepted chat types, ChatTypeFilter.PRIVATE or ChatTypeFilter.GROUP.
+        """
+        self._chat_types = frozenset(chat_types)
+
+    @staticmethod
+    def chat_type(message):
+        """
+        Return the type of the chat of a message, private chats are represented by a User.
+        :param message: Message, Message to check.
+        """
+        return ChatTypeFilter.PRIVATE if isinstance(message.chat, User) else ChatTypeFilter.GROUP
+
+    def __call__(self, message):
+        return self.chat_type(message) in self._chat_types
+
+
+class UserFilter(Filter):
+    """
+    Filter that accepts or rejects messages by sender id. Useful also in order to ignore the bot's own messages:
+
+        api.add_filter(UserFilter(deny=[api.bot.id]))
+    """
+
+    def __init__(self, allow=None, deny=None):
+        """
+        :param allow: Iterable of Integer, Optional. If given, only these users are accepted.
+        :param deny: Iterable of Integer, Optional. Users that are always rejected.
+        """
+        self._allow = None if allow is None else frozenset(allow)
+        self._deny = frozenset(deny or ())
+
+    def __call__(self, message):
+        user_id = message.message_from.id
+        if user_id in self._deny:
+            return False
+        return self._allow is None or user_id in self._allow
+
+
+class FloodFilter(Filter):
+    """
+    Filter that rejects the messages of a user exceeding limit messages in a sliding window of window seconds. Rejected
+    messages do not count, so a user is accepted again as soon as the window slides.
+    """
+
+    def __init__(self, limit, window, max_users=100000):
+        """
+        :param limit: Integer, Maximum number of messages of a user in the window.
+        :param window: Float, Length of the window in seconds.
+        :param max_users: Integer, Optional. Maximum number of tracked users, the least recently seen are forgotten.
+        """
+        self._limit = limit
+        self._window = window
+        self._max_users = max_users
+        self._hits = OrderedDict()  # user id -> deque of the times of the last accepted messages
+
+    def __call__(self, message):
+        now = time.monotonic()
+        user_id = message.message_from.id
+
+        hits = self._hits.get(user_id)
+        if hits is None:
+            hits = self._hits[user_id] = deque(maxlen=self._limit)
+            if len(self._hits) > self._max_users:
+                self._hits.popitem(last=False)
+        else:
+            self._hits.move_to_end(user_id)
+
+        if len(hits) == self._limit and now - hits[0] < self._window:
+            return False
+
+        hits.append(now)
+        return True
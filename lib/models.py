@@ -1,4 +1,8 @@
 import json
+import threading
+import weakref
+
+from lib.preprocessing import TextFeatures
 
 
 def as_json(dictionary):
@@ -7,12 +11,34 @@ def as_json(dictionary):
     :param dictionary: Dict, Dictionary to analyze.
     :return: The right object represented in the JSON.
     """
-    if "first_name" in dictionary:
+    if "phone_number" in dictionary:
+        return Contact(**dictionary)
+    elif "first_name" in dictionary:
         return User(**dictionary)
+    elif "title" in dictionary:
+        return GroupChat(**dictionary)
     elif "update_id" in dictionary:
         return Update(**dictionary)
     elif "result" in dictionary:
         return Response(**dictionary)
+    elif "ok" in dictionary:  # Response of a failed request, without result
+        return Response(dictionary["ok"], description=dictionary.get("description"),
+                        error_code=dictionary.get("error_code"))
+    elif "longitude" in dictionary:
+        return Location(**dictionary)
+    elif "total_count" in dictionary:
+        return UserProfilePhotos(**dictionary)
+    elif "file_id" in dictionary and "width" in dictionary and "thumb" not in dictionary and \
+            "duration" not in dictionary:
+        return PhotoSize(**dictionary)
+    elif "file_id" in dictionary and "width" in dictionary and "duration" in dictionary:
+        return Video(**dictionary)
+    elif "file_id" in dictionary and "width" in dictionary:
+        return Sticker(**dictionary)
+    elif "file_id" in dictionary and "duration" in dictionary:
+        return Audio(**dictionary)
+    elif "file_id" in dictionary:
+        return Document(**dictionary)
     else:
         dictionary["message_from"] = dictionary["from"]
         del dictionary["from"]
@@ -25,9 +51,13 @@ class JSONEncoder(json.JSONEncoder):
     """
 
     def default(self, obj):
+        if hasattr(obj, "materialize"):  # LazyMessage, build the fields not read yet
+            obj.materialize()
         dictionary = dict()
+        transient = getattr(obj, "_TRANSIENT", ())
         for key in obj.__dict__.keys():
-            dictionary.update({key[1:]: obj.__dict__[key]})
+            if key not in transient:
+                dictionary.update({key[1:]: obj.__dict__[key]})
         return dictionary
 
 
@@ -36,6 +66,46 @@ class Jsonable():
     Father class for all object that can serialized/deserialized from/to JSON.
     """
 
+    _live = None  # WeakSet of the instances created while tracked, see track_instances
+    _trackers = 0
+    _trackers_lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        obj = super().__new__(cls)
+        live = Jsonable._live
+        if live is not None:
+            live.add(obj)
+        return obj
+
+    @staticmethod
+    def track_instances(enabled=True):
+        """
+        Static method that starts, or stops, keeping a weak reference to every object created, so the live ones can
+        be counted without scanning the heap. Calls are counted: tracking stops when every start has been stopped.
+        :param enabled: Boolean, Optional. True in order to start, False in order to stop.
+        """
+        with Jsonable._trackers_lock:
+            Jsonable._trackers += 1 if enabled else -1
+            if Jsonable._trackers > 0 and Jsonable._live is None:
+                Jsonable._live = weakref.WeakSet()
+            elif Jsonable._trackers <= 0:
+                Jsonable._trackers = 0
+                Jsonable._live = None
+
+    @staticmethod
+    def live_instances():
+        """
+        Static method that returns the live objects created while tracked, see track_instances.
+        :return: List of Jsonable, empty if not tracking.
+        """
+        live = Jsonable._live
+        while live is not None:
+            try:
+                return list(live)
+            except RuntimeError:  # Changed by another thread while copying, try again
+                continue
+        return []
+
     @staticmethod
     def to_json(obj):
         """
@@ -103,6 +173,35 @@ class Response(Jsonable):
         return self._error_code
 
 
+class APIError(Exception):
+    """
+    Raised when the Bot API refuses a request whose response can not be returned as it is, e.g. getUpdates.
+    """
+
+    def __init__(self, error_code, description):
+        """
+        :param error_code: Integer, Code of the error, e.g. 401 for a wrong token or 409 for a conflict of polling.
+        :param description: String, Human-readable description of the error.
+        """
+        super().__init__("%s %s" % (error_code, description))
+        self._error_code = error_code
+        self._description = description
+
+    @property
+    def error_code(self):
+        """
+        Code of the error.
+        """
+        return self._error_code
+
+    @property
+    def description(self):
+        """
+        Human-readable description of the error.
+        """
+        return self._description
+
+
 class User(Jsonable):
     """
     This object represents a Telegram user or bot.
@@ -182,6 +281,9 @@ class Message(Jsonable):
     This object represents a message.
     """
 
+    _TRANSIENT = ("_features",)  # Derived fields, not serialized
+    _features = None
+
     def __init__(self, message_id, message_from, date, chat, forward_from=None, forward_date=None,
                  reply_to_message=None, text=None, audio=None, document=None, photo=None, sticker=None, video=None,
                  contact=None, location=None, new_chat_participant=None, left_chat_participant=None,
@@ -383,6 +485,16 @@ class Message(Jsonable):
         """
         return self._group_chat_created
 
+    @property
+    def features(self):
+        """
+        TextFeatures of the text: normalized text, tokens, command and argument. Computed by the pre-processing of the
+        batch if enabled, see TelegramBotAPI.preprocessing, otherwise on first access.
+        """
+        if self._features is None:
+            self._features = TextFeatures(self._text)
+        return self._features
+
 
 class PhotoSize(Jsonable):
     """
@@ -0,0 +1,274 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+from lib import TelegramBotAPI
+from lib.models import APIError, Jsonable
+from lib.termination import TerminationHandler
+
+
+class BotMultiplexer(object):
+    """
+    Host many TelegramBotAPI in one process sharing one connection pool and one scheduling loop.
+    You can simply use it in this way:
+
+        multiplexer = BotMultiplexer()
+        first = multiplexer.add_bot(FIRST_TOKEN)
+        second = multiplexer.add_bot(SECOND_TOKEN)
+
+
+        @first.respond_to("Hello")
+        def respond(message):
+            first.sendMessage(message.chat.id, "Hi!")
+
+
+        multiplexer.run()
+
+    All bots are polled concurrently, but updates are always dispatched from the loop thread, so listeners of the same
+    bot are never called concurrently. A bot whose poll fails waits ERROR_DELAY seconds before polling again, without
+    stopping the others, while an update that cannot be built is skipped. Bots added while running are polled too, up
+    to max_workers at a time.
+    """
+
+    ERROR_DELAY = 1.0  # Seconds a bot waits before polling again after an error
+
+    def __init__(self, pool_size=10, debug=False, max_workers=32):
+        """
+        :param pool_size: Integer, Optional. Maximum number of pooled connections kept alive towards the Bot API.
+            Defaults to 10, use at least the number of bots when long polling.
+        :param debug: Boolean, Optional. If True polling errors are printed.
+        :param max_workers: Integer, Optional. Maximum number of bots polled at the same time.
+        """
+        self._bots = []
+        self._delays = dict()  # bot -> seconds to wait before its next poll, after an error
+        self._max_workers = max_workers
+        self._webhooks = dict()
+        self._debug = debug
+        self._running = threading.Event()
+        self._thread = None
+        self._termination = TerminationHandler(self.stop)
+        self._closed = False
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+
+    @property
+    def bots(self):
+        """
+        List of the hosted bots.
+        """
+        return list(self._bots)
+
+    @property
+    def session(self):
+        """
+        Session shared between all the hosted bots.
+        """
+        return self._session
+
+    def add_bot(self, token, bot=None, debug=False):
+        """
+        Create a new TelegramBotAPI that uses the shared connection pool and host it.
+        :param token: String, Token of the bot.
+        :param bot: User, Optional. User that represent the bot, if None it is requested with getMe.
+        :param debug: Boolean, Optional. Debug mode of the bot.
+        :return: The created TelegramBotAPI.
+        """
+        api = TelegramBotAPI(token, bot=bot, debug=debug, session=self._session)
+        self._add(api, token)
+        return api
+
+    def add(self, api, token):
+        """
+        Host an already created TelegramBotAPI, its session is replaced with the shared one.
+        :param api: TelegramBotAPI, Bot to host.
+        :param token: String, Token of the bot, used only in order to route webhooks.
+        """
+        api.session = self._session
+        self._add(api, token)
+
+    def _add(self, api, token):
+        """
+        Private method that registers a bot and its webhook path.
+        """
+        self._bots.append(api)
+        self._webhooks[self.webhook_path(token)] = api
+
+    def remove(self, api):
+        """
+        Stop hosting a bot.
+        :param api: TelegramBotAPI, Bot to remove.
+        """
+        self._bots.remove(api)
+        self._delays.pop(api, None)
+        for path, hosted in list(self._webhooks.items()):
+            if hosted is api:
+                del self._webhooks[path]
+
+    @staticmethod
+    def webhook_path(token):
+        """
+        Return the path on which the webhook of a bot is accepted.
+        :param token: String, Token of the bot.
+        """
+        return "/" + token
+
+    def handle_webhook(self, path, body):
+        """
+        Route the body of a webhook request to the right bot.
+        :param path: String, Path of the request.
+        :param body: String, JSON-serialized Update.
+        :return: True if a bot is registered for the path, False otherwise.
+        """
+        api = self._webhooks.get(path)
+        if api is None:
+            return False
+
+        api.process_updates([Jsonable.from_text(body)])
+        return True
+
+    def serve_webhooks(self, address=("", 8443)):
+        """
+        Accept the webhooks of all the hosted bots on one server. Requests are served one at a time, so this is also the
+        scheduling loop of the bots.
+        :param address: Tuple, Optional. Address (host, port) on which the server listens.
+        """
+        multiplexer = self
+
+        class WebhookHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length).decode("utf-8")
+                self.send_response(200 if multiplexer.handle_webhook(self.path, body) else 404)
+                self.end_headers()
+
+        server = HTTPServer(address, WebhookHandler)
+        server.serve_forever()
+
+    def run(self):
+        """
+        This method starts polling all the hosted bots concurrently and blocks until stop is called or SIGTERM is
+        received. A stopped multiplexer can not be started again, since its bots are closed.
+        """
+        if self._closed:
+            raise Exception("Multiplexer closed")
+
+        self._running.set()
+        self._termination.install(background=False)
+        try:
+            self._loop()
+        finally:
+            self._termination.restore()
+
+    def start(self):
+        """
+        This method starts polling all the hosted bots in a background thread and returns immediately. On SIGTERM the
+        multiplexer is stopped, and then the previous handler of the signal is called, see TerminationHandler. As with
+        run, a stopped multiplexer can not be started again.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self._closed:
+            raise Exception("Multiplexer closed")
+
+        self._running.set()
+        self._termination.install(background=True)
+        self._thread = threading.Thread(target=self._loop, name="BotMultiplexer")
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop polling. The polls in progress are waited and their updates dispatched, then all bots are closed, see
+        TelegramBotAPI.close, and the shared connections are closed.
+        :param timeout: Float, Optional. Maximum seconds to wait for the multiplexer started with start, by default
+            waits until it is stopped.
+        :return: True if the multiplexer is stopped, False if the timeout expired.
+        """
+        self._running.clear()
+        if self._thread is None or self._thread is threading.current_thread():
+            return True
+
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return False
+        self._termination.restore()
+        return True
+
+    def _loop(self):
+        """
+        Private method that polls until the multiplexer is stopped.
+        """
+        try:
+            with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+                pending = dict()  # future -> bot
+
+                while True:
+                    # Bots added while running are polled from the next round
+                    polled = set(pending.values())
+                    if self._running.is_set():
+                        for api in self._bots:
+                            if api not in polled:
+                                pending[executor.submit(self._poll, api, self._delays.pop(api, 0))] = api
+                    if not pending:
+                        if not self._running.is_set():
+                            break
+                        time.sleep(self.ERROR_DELAY)  # No bots yet
+                        continue
+
+                    done, _ = wait(pending, timeout=self.ERROR_DELAY, return_when=FIRST_COMPLETED)
+
+                    for future in done:
+                        api = pending.pop(future)
+                        try:
+                            self._dispatch(api, future.result())
+                        except (requests.RequestException, APIError, ValueError) as e:
+                            # Only this bot backs off, the others keep polling
+                            self._delays[api] = self.ERROR_DELAY
+                            if self._debug:  # If in debug mode, print the error and keep polling
+                                print(e)
+        finally:
+            self._running.clear()
+            self._shutdown()
+
+    def _dispatch(self, api, updates):
+        """
+        Private method that dispatches the updates of a bot. An update whose message cannot be built, e.g. a lazy one
+        with fields unknown to the models, is skipped, since it would fail in the same way at every poll.
+        """
+        while updates:
+            try:
+                api.process_updates(updates)
+                return
+            except (KeyError, TypeError) as e:
+                updates = [update for update in updates if update.update_id >= api.offset]
+                if not updates:
+                    return
+                api.offset = updates[0].update_id + 1  # Skip the update that failed, dispatch the others
+                updates = updates[1:]
+                if self._debug:  # If in debug mode, print the error and keep dispatching
+                    print(e)
+
+    def _poll(self, api, delay=0):
+        """
+        Private method that waits delay seconds, unless stopped, and polls a bot.
+        :return: The updates of the bot, none if stopped while waiting.
+        """
+        if delay:
+            time.sleep(delay)
+            if not self._running.is_set():
+                return []
+        return api.getUpdates()
+
+    def _shutdown(self):
+        """
+        Private method that closes all bots, so their delayed messages are sent and their offsets committed, and
+        releases the shared connections.
+        """
+        self._closed = True
+        for api in self._bots:
+            api.close()
+
+        self._session.close()
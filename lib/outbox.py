@@ -0,0 +1,281 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+
+
+class DurableOutbox(object):
+    """
+    Write-ahead queue of the messages to send, so the replies accepted by sendMessage survive a crash. You can simply
+    use it in this way:
+
+        api.outbox = DurableOutbox(api, "outbox")
+
+    Every message is appended to a log on disk before being sent, and an acknowledgement is appended as soon as
+    sendMessage returns ok; at startup the messages without acknowledgement are sent again. Appends waiting together are
+    written with a single fsync (group commit), so durability costs about commit_interval of latency per message, not
+    an fsync each. The log is split in segments of segment_size bytes, and the oldest segments are deleted as soon as
+    all their messages are acknowledged. Messages are sent one at a time in order, so the order of each chat is kept.
+    """
+
+    RETRY_DELAY = 1.0  # Seconds between two attempts of a message that can be retried
+
+    def __init__(self, api, directory, segment_size=4 * 1024 * 1024, commit_interval=0.002, max_segments=8):
+        """
+        :param api: TelegramBotAPI, Client used in order to send the messages.
+        :param directory: String, Directory of the log, created if missing.
+        :param segment_size: Integer, Optional. Size in bytes after which a new segment is started.
+        :param commit_interval: Float, Optional. Seconds an append waits for others in order to commit them together.
+        :param max_segments: Integer, Optional. Number of segments above which the messages not acknowledged of the
+            oldest one are copied into the current one, so it can be deleted.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._api = api
+        self._directory = directory
+        self._segment_size = segment_size
+        self._commit_interval = commit_interval
+        self._max_segments = max_segments
+
+        self._condition = threading.Condition()
+        self._buffer = []  # (record, (id, data) if it is a send) waiting for the commit
+        self._appended = 0  # Sequence of the last appended record
+        self._committed = 0  # Sequence of the last committed record
+        self._to_deliver = deque()  # (id, data) committed and not sent yet
+        self._unacked = dict()  # id -> (segment, data)
+        self._segments = dict()  # segment -> number of messages not acknowledged
+        self._next_id = 1
+        self._closed = False
+        self._sent = 0
+        self._failed = 0
+
+        self._replay()
+        self._file = open(self._segment_path(self._segment), "ab")
+
+        self._committer = threading.Thread(target=self._commit_loop, name="DurableOutbox-commit", daemon=True)
+        self._committer.start()
+        self._deliverer = threading.Thread(target=self._deliver_loop, name="DurableOutbox-deliver", daemon=True)
+        self._deliverer.start()
+
+    def __len__(self):
+        """
+        Return the number of messages not acknowledged yet.
+        """
+        with self._condition:
+            return len(self._unacked)
+
+    @property
+    def sent(self):
+        """
+        Number of messages sent and acknowledged.
+        """
+        return self._sent
+
+    @property
+    def failed(self):
+        """
+        Number of messages refused by the server and dropped, since they would be refused again.
+        """
+        return self._failed
+
+    def send(self, data):
+        """
+        Append a message to the log and return when it is durable, it is sent in background.
+        :param data: Dict, Parameters of sendMessage, JSON-serializable.
+        :return: Identifier of the message in the outbox.
+        """
+        with self._condition:
+            if self._closed:
+                raise Exception("Outbox closed")
+
+            message_id = self._next_id
+            self._next_id += 1
+            self._unacked[message_id] = (self._segment, data)
+            self._segments[self._segment] = self._segments.get(self._segment, 0) + 1
+            sequence = self._append({"op": "send", "id": message_id, "data": data}, (message_id, data))
+
+            while self._committed < sequence:
+                self._condition.wait()
+        return message_id
+
+    def close(self, timeout=5.0):
+        """
+        Wait up to timeout for the pending messages to be sent, then commit the log and close it. Messages not sent
+        are sent again by the next outbox on the same directory.
+        :param timeout: Float, Optional. Maximum seconds to wait for the pending messages.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._unacked and time.monotonic() < deadline:
+                self._condition.wait(deadline - time.monotonic())
+            self._closed = True
+            self._condition.notify_all()
+
+        self._deliverer.join(max(deadline - time.monotonic(), 0))
+        self._committer.join()
+        self._file.close()
+
+    def _append(self, record, send=None):
+        """
+        Private method that adds a record to the next commit, the lock must be held.
+        :param record: Dict, Record to write.
+        :param send: Tuple, Optional. (id, data) of the message to deliver once the record is committed.
+        :return: Sequence of the record.
+        """
+        self._buffer.append((json.dumps(record).encode("utf-8") + b"\n", send))
+        self._appended += 1
+        self._condition.notify_all()
+        return self._appended
+
+    def _commit_loop(self):
+        """
+        Private method that writes and fsyncs the waiting records in groups.
+        """
+        while True:
+            with self._condition:
+                while not self._buffer and not self._closed:
+                    self._condition.wait()
+                if not self._buffer and self._closed:
+                    return
+
+            time.sleep(self._commit_interval)  # Let other appends join this commit
+
+            with self._condition:
+                records = self._buffer
+                self._buffer = []
+                sequence = self._appended
+                segment = self._segment
+
+            self._write(line for line, _ in records)
+
+            with self._condition:
+                self._to_deliver.extend(send for _, send in records if send is not None)
+                self._committed = sequence
+                self._condition.notify_all()
+
+            if self._file.tell() >= self._segment_size:
+                self._roll(segment)
+
+    def _write(self, lines):
+        """
+        Private method that writes lines to the current segment and makes them durable.
+        """
+        self._file.write(b"".join(lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _roll(self, segment):
+        """
+        Private method that starts a new segment and deletes the old ones not needed anymore.
+        """
+        self._file.close()
+        self._file = open(self._segment_path(segment + 1), "ab")
+
+        copies = []
+        with self._condition:
+            self._segment = segment + 1
+            self._segments.setdefault(self._segment, 0)
+
+            oldest = min(self._segments)
+            if len(self._segments) > self._max_segments and self._segments[oldest]:
+                # Copy the messages still waiting into the current segment, so the oldest can be deleted
+                for message_id, (message_segment, data) in list(self._unacked.items()):
+                    if message_segment == oldest:
+                        self._unacked[message_id] = (self._segment, data)
+                        self._segments[self._segment] += 1
+                        copies.append(json.dumps({"op": "send", "id": message_id, "data": data}).encode("utf-8") +
+                                      b"\n")
+                self._segments[oldest] = 0
+
+        if copies:
+            self._write(copies)  # Durable before the oldest segment is deleted
+        self._compact()
+
+    def _compact(self):
+        """
+        Private method that deletes the oldest segments whose messages are all acknowledged. Segments are deleted only
+        in order, since the acknowledgements of a segment can be in the next ones.
+        """
+        with self._condition:
+            while len(self._segments) > 1:
+                oldest = min(self._segments)
+                if self._segments[oldest] or oldest == self._segment:
+                    return
+                del self._segments[oldest]
+                try:
+                    os.remove(self._segment_path(oldest))
+                except OSError:
+                    pass
+
+    def _deliver_loop(self):
+        """
+        Private method that sends the committed messages in order.
+        """
+        while True:
+            with self._condition:
+                while not self._to_deliver and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                message_id, data = self._to_deliver[0]
+
+            try:
+                response = self._api._deliver_message(data)
+            except (requests.RequestException, ValueError):
+                time.sleep(self.RETRY_DELAY)  # Network error, retry the same message
+                continue
+
+            if not response.get("ok"):
+                error_code = response.get("error_code") or 0
+                if error_code == 429 or error_code >= 500:
+                    time.sleep(self.RETRY_DELAY)  # Too many requests or server error, retry the same message
+                    continue
+                self._failed += 1
+            else:
+                self._sent += 1
+
+            with self._condition:
+                self._to_deliver.popleft()
+                segment, _ = self._unacked.pop(message_id)
+                self._segments[segment] -= 1
+                self._append({"op": "ack", "id": message_id})
+                self._condition.notify_all()
+
+    def _replay(self):
+        """
+        Private method that reads the log and queues again the messages without acknowledgement.
+        """
+        segments = sorted(int(name[8:-4]) for name in os.listdir(self._directory)
+                          if name.startswith("segment-") and name.endswith(".log"))
+
+        for segment in segments:
+            self._segments[segment] = 0
+            with open(self._segment_path(segment), "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line.decode("utf-8"))
+                    except ValueError:
+                        continue  # Record truncated by a crash, never committed
+                    message_id = record["id"]
+                    self._next_id = max(self._next_id, message_id + 1)
+                    if record["op"] == "send":
+                        if message_id in self._unacked:
+                            self._segments[self._unacked[message_id][0]] -= 1  # Copied by a compaction
+                        self._unacked[message_id] = (segment, record["data"])
+                        self._segments[segment] += 1
+                    elif message_id in self._unacked:
+                        self._segments[self._unacked.pop(message_id)[0]] -= 1
+
+        self._segment = segments[-1] + 1 if segments else 0
+        self._segments[self._segment] = 0
+        for message_id in sorted(self._unacked):
+            self._to_deliver.append((message_id, self._unacked[message_id][1]))
+        self._compact()
+
+    def _segment_path(self, segment):
+        """
+        Private method that returns the path of a segment.
+        """
+        return os.path.join(self._directory, "segment-%08d.log" % segment)
@@ -0,0 +1,129 @@
+import re
+
+TOKEN = re.compile(r"\w+")
+_MENTION = re.compile(r"(?:^|\s)@\w")
+_HASHTAG = re.compile(r"(?:^|\s)#\w")
+_URL = re.compile(r"https?://|www\.|\b[\w-]+\.(?:com|org|net|io|me)\b", re.IGNORECASE)
+
+
+def tokenize(text):
+    """
+    Return the lower case words of a text.
+    :param text: String, Text to split.
+    """
+    return TOKEN.findall(text.lower())
+
+
+class TextFeatures(object):
+    """
+    Features of the text of a message, computed once and shared by every router and handler, see Message.features.
+    Instances are immutable, so messages with the same text share the same instance.
+    """
+
+    __slots__ = ("_text", "_normalized", "_tokens", "_command", "_argument", "_flags")
+
+    MENTION = 1
+    HASHTAG = 2
+    URL = 4
+
+    def __init__(self, text):
+        """
+        :param text: String, Text of the message, can be None.
+        """
+        self._text = text
+        if not text:
+            self._normalized = text
+            self._tokens = ()
+            self._command = None
+            self._argument = None
+            self._flags = 0
+            return
+
+        words = text.split()
+        self._normalized = " ".join(text.lower().split())
+        self._tokens = tuple(TOKEN.findall(self._normalized))
+
+        if words and words[0].startswith("/") and len(words[0]) > 1:
+            self._command = words[0].split("@", 1)[0]  # Without the username of the bot, as in /start@my_bot
+            self._argument = text.strip()[len(words[0]):].strip()
+        else:
+            self._command = None
+            self._argument = None
+
+        self._flags = ((self.MENTION if _MENTION.search(text) else 0) |
+                       (self.HASHTAG if _HASHTAG.search(text) else 0) |
+                       (self.URL if _URL.search(text) else 0))
+
+    @property
+    def text(self):
+        """
+        Original text.
+        """
+        return self._text
+
+    @property
+    def normalized(self):
+        """
+        Text in lower case with single spaces.
+        """
+        return self._normalized
+
+    @property
+    def tokens(self):
+        """
+        Tuple of the words of the normalized text, without punctuation.
+        """
+        return self._tokens
+
+    @property
+    def command(self):
+        """
+        Command the text starts with, e.g. "/start" for "/start@my_bot now", None if it is not a command.
+        """
+        return self._command
+
+    @property
+    def argument(self):
+        """
+        Text after the command, e.g. "now" for "/start@my_bot now", None if it is not a command.
+        """
+        return self._argument
+
+    @property
+    def has_mention(self):
+        """
+        True if the text mentions a username.
+        """
+        return bool(self._flags & self.MENTION)
+
+    @property
+    def has_hashtag(self):
+        """
+        True if the text contains a hashtag.
+        """
+        return bool(self._flags & self.HASHTAG)
+
+    @property
+    def has_url(self):
+        """
+        True if the text contains a link.
+        """
+        return bool(self._flags & self.URL)
+
+
+def preprocess(messages, features=None):
+    """
+    Compute the TextFeatures of a batch of messages and attach them, see Message.features. Each distinct text is
+    processed once in the whole batch, so repeated commands and messages cost a lookup.
+    :param messages: Iterable of Message, Messages to process.
+    :param features: Dict, Optional. Features already computed, text -> TextFeatures, updated with the new ones. Pass
+        the same dict in order to share them among messages processed in more calls.
+    """
+    if features is None:
+        features = dict()
+    for message in messages:
+        text = message.text
+        shared = features.get(text)
+        if shared is None:
+            shared = features[text] = TextFeatures(text)
+        message._features = shared
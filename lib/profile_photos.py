@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+def best_photo_size(sizes, width=None, height=None):
+    """
+    Return the best fitting size of a photo: the smallest one at least as big as width and height, or the biggest one
+    if none is big enough. Without width and height the biggest one is returned.
+    :param sizes: Array of PhotoSize, Available sizes of the photo.
+    :param width: Integer, Optional. Wanted width.
+    :param height: Integer, Optional. Wanted height.
+    :return: The best fitting PhotoSize, None if sizes is empty.
+    """
+    if not sizes:
+        return None
+
+    by_area = sorted(sizes, key=lambda size: size.width * size.height)
+    for size in by_area:
+        if (width is None or size.width >= width) and (height is None or size.height >= height) and \
+                (width is not None or height is not None):
+            return size
+    return by_area[-1]
+
+
+def iter_user_profile_photos(api, user_id, page_size=100, best_fit=None):
+    """
+    Generator that walks all the profile pictures of a user page by page, requesting the next page while the current
+    one is consumed. You can simply use it in this way:
+
+        for photo in iter_user_profile_photos(api, user_id, best_fit=(160, 160)):
+            download(photo.file_id)
+
+    :param api: TelegramBotAPI, Client used in order to request the pages.
+    :param user_id: Integer, Unique identifier of the target user.
+    :param page_size: Integer, Optional. Number of photos requested for each page, between 1—100.
+    :param best_fit: Tuple, Optional. (width, height) wanted, if given only the best fitting PhotoSize of each photo is
+        yielded, see best_photo_size. By default the Array of PhotoSize of each photo is yielded.
+    :raise APIError: If a page is refused, see getUserProfilePhotos.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        offset = 0
+        page = executor.submit(api.getUserProfilePhotos, user_id, offset, page_size)
+
+        while page is not None:
+            photos = page.result()
+            if not photos or not photos.photos:
+                return
+
+            offset += len(photos.photos)
+            if offset < photos.total_count:  # Prefetch the next page
+                page = executor.submit(api.getUserProfilePhotos, user_id, offset, page_size)
+            else:
+                page = None
+
+            for sizes in photos.photos:
+                yield sizes if best_fit is None else best_photo_size(sizes, *best_fit)
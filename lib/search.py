@@ -0,0 +1,146 @@
+from array import array
+from bisect import bisect_left
+
+from lib.preprocessing import tokenize
+
+
+class _Segment(object):
+    """
+    Private class that indexes up to size messages: each term has a sorted posting list of the rows of the messages
+    containing it, chat id, message id and date of each row are kept in parallel arrays.
+    """
+
+    def __init__(self):
+        self.postings = dict()  # term -> array of rows
+        self.chat_ids = array("q")
+        self.message_ids = array("q")
+        self.dates = array("q")
+        self._terms = []  # Sorted terms, for prefix queries
+        self._new_terms = []  # Terms added after the last sort
+
+    def __len__(self):
+        return len(self.chat_ids)
+
+    def add(self, chat_id, message_id, date, terms):
+        row = len(self.chat_ids)
+        self.chat_ids.append(chat_id)
+        self.message_ids.append(message_id)
+        self.dates.append(date)
+
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = array("I")
+                self._new_terms.append(term)
+            postings.append(row)
+
+    def rows(self, term, prefix=False):
+        """
+        Return the set of rows containing term, or a word starting with term if prefix.
+        """
+        if not prefix:
+            return set(self.postings.get(term, ()))
+
+        if self._new_terms:  # Sorting two sorted runs is linear
+            self._new_terms.sort()
+            self._terms += self._new_terms
+            self._terms.sort()
+            self._new_terms = []
+
+        rows = set()
+        for i in range(bisect_left(self._terms, term), len(self._terms)):
+            if not self._terms[i].startswith(term):
+                break
+            rows.update(self.postings[self._terms[i]])
+        return rows
+
+
+class MessageSearchIndex(object):
+    """
+    Incremental full-text index of the received messages. You can simply use it in this way:
+
+        index = MessageSearchIndex()
+        api.add_post_handler(index)
+
+
+        @api.respond_to("/find")
+        def respond(message):
+            results = index.search("invoice", chat_id=message.chat.id, prefix=True)
+
+    Messages are indexed in segments of segment_size messages, when there are more than max_segments the oldest one is
+    evicted, so memory is bounded and old messages are forgotten first.
+    """
+
+    def __init__(self, segment_size=10000, max_segments=10):
+        """
+        :param segment_size: Integer, Optional. Number of messages of each segment.
+        :param max_segments: Integer, Optional. Maximum number of segments kept.
+        """
+        self._segment_size = segment_size
+        self._max_segments = max_segments
+        self._segments = [_Segment()]
+
+    def __len__(self):
+        """
+        Return the number of indexed messages.
+        """
+        return sum(len(segment) for segment in self._segments)
+
+    def __call__(self, message, handled=None):
+        """
+        Same as add, so the index can be used directly as a post handler.
+        """
+        self.add(message)
+
+    def add(self, message):
+        """
+        Index the text of a message, messages without text are skipped.
+        :param message: Message, Message to index.
+        """
+        if not message.text:
+            return
+
+        segment = self._segments[-1]
+        if len(segment) >= self._segment_size:
+            segment = _Segment()
+            self._segments.append(segment)
+            if len(self._segments) > self._max_segments:
+                del self._segments[0]
+
+        chat_id = getattr(message, "chat_id", None)  # A LazyMessage does not build the chat
+        if chat_id is None:
+            chat_id = message.chat.id
+        segment.add(chat_id, message.message_id, message.date, set(message.features.tokens))
+
+    def search(self, query, chat_id=None, prefix=False, since=None, limit=20):
+        """
+        Return the messages containing all the words of a query, from the newest.
+        :param query: String, Words to search.
+        :param chat_id: Integer, Optional. If given, only the messages of this chat are returned.
+        :param prefix: Boolean, Optional. If True the last word of the query matches also the words starting with it.
+        :param since: Integer, Optional. Minimum date in Unix time of the messages.
+        :param limit: Integer, Optional. Maximum number of results.
+        :return: An Array of (chat_id, message_id, date).
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        results = []
+        for segment in reversed(self._segments):
+            rows = None
+            for i, term in enumerate(terms):
+                found = segment.rows(term, prefix and i == len(terms) - 1)
+                rows = found if rows is None else rows & found
+                if not rows:
+                    break
+
+            for row in sorted(rows, reverse=True):
+                if chat_id is not None and segment.chat_ids[row] != chat_id:
+                    continue
+                if since is not None and segment.dates[row] < since:
+                    continue
+                results.append((segment.chat_ids[row], segment.message_ids[row], segment.dates[row]))
+                if len(results) >= limit:
+                    return results
+        return results
@@ -0,0 +1,99 @@
+import time
+
+from lib.middleware import ChatTypeFilter
+
+
+class LoadShedder(object):
+    """
+    Overload policy applied to every update before dispatching it. You can simply use it in this way:
+
+        api.shedder = LoadShedder(max_age=60, max_depth=50)
+
+    Messages older than max_age seconds are stale: they are passed to stale_handler, if any, instead of the listeners.
+    When more than max_depth updates are waiting behind a message, the messages without priority are shed, by default
+    the ones coming from groups. So after a spike the backlog is drained quickly and live users are answered first.
+    """
+
+    def __init__(self, max_age=None, max_depth=None, priority=None, stale_handler=None, on_shed=None):
+        """
+        :param max_age: Float, Optional. Seconds after which a message is stale, by default messages never get stale.
+        :param max_depth: Integer, Optional. Number of waiting updates above which low priority messages are shed, by
+            default nothing is shed.
+        :param priority: Function, Optional. Function that takes a Message and returns True if it has priority, by
+            default private chats have priority over groups.
+        :param stale_handler: Function, Optional. Function called with the stale messages, e.g. in order to apologize
+            for the delay, by default they are dropped.
+        :param on_shed: Function, Optional. Function called with every message not dispatched and the reason, "stale"
+            or "shed".
+        """
+        self._max_age = max_age
+        self._max_depth = max_depth
+        self._priority = priority if priority is not None else self.private_chat
+        self._stale_handler = stale_handler
+        self._on_shed = on_shed
+        self._stale = 0
+        self._shed = 0
+        self._admitted = 0
+
+    @staticmethod
+    def private_chat(message):
+        """
+        Default priority: True if the message comes from a private chat.
+        :param message: Message, Message to check.
+        """
+        return ChatTypeFilter.chat_type(message) == ChatTypeFilter.PRIVATE
+
+    @property
+    def stale(self):
+        """
+        Number of messages not dispatched because stale.
+        """
+        return self._stale
+
+    @property
+    def shed(self):
+        """
+        Number of messages not dispatched because without priority during an overload.
+        """
+        return self._shed
+
+    @property
+    def admitted(self):
+        """
+        Number of messages dispatched.
+        """
+        return self._admitted
+
+    def stats(self):
+        """
+        Return a dict with all the counters.
+        """
+        return {"admitted": self._admitted, "stale": self._stale, "shed": self._shed}
+
+    def admit(self, message, depth=0, now=None):
+        """
+        Decide if a message has to be dispatched.
+        :param message: Message, Message to check.
+        :param depth: Integer, Optional. Number of updates waiting behind the message.
+        :param now: Float, Optional. Current Unix time, by default time.time().
+        :return: True if the message has to be dispatched, False if it was handled as stale or shed.
+        """
+        if self._max_age is not None:
+            if now is None:
+                now = time.time()
+            if now - message.date > self._max_age:
+                self._stale += 1
+                if self._stale_handler is not None:
+                    self._stale_handler(message)
+                if self._on_shed is not None:
+                    self._on_shed(message, "stale")
+                return False
+
+        if self._max_depth is not None and depth > self._max_depth and not self._priority(message):
+            self._shed += 1
+            if self._on_shed is not None:
+                self._on_shed(message, "shed")
+            return False
+
+        self._admitted += 1
+        return True
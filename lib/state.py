@@ -0,0 +1,198 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class StateStore(object):
+    """
+    Father class for all stores of the conversation state, keyed by chat or user id.
+    """
+
+    def get(self, key):
+        """
+        Return the state of a key or None if missing or expired.
+        :param key: Integer or String, Chat or user id.
+        """
+        raise NotImplementedError
+
+    def set(self, key, state):
+        """
+        Set the state of a key.
+        :param key: Integer or String, Chat or user id.
+        :param state: Object, JSON-serializable state.
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Remove the state of a key.
+        :param key: Integer or String, Chat or user id.
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """
+        Make the writes done so far durable, if the store delays them.
+        """
+        pass
+
+    def close(self):
+        """
+        Release all the resources of the store.
+        """
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """
+    In-memory state store with TTL expiry. All operations are O(1): since all states have the same TTL, the insertion
+    order is also the expiry order, so expired states are always at the head of the dict.
+    """
+
+    def __init__(self, ttl=None, max_size=None):
+        """
+        :param ttl: Float, Optional. Seconds after the last set in which a state expires. By default states never
+            expire.
+        :param max_size: Integer, Optional. Maximum number of states, when exceeded the least recently set is removed.
+        """
+        self._ttl = ttl
+        self._max_size = max_size
+        self._states = OrderedDict()  # key -> (state, expiry time)
+
+    def __len__(self):
+        return len(self._states)
+
+    def get(self, key):
+        self._purge()
+        item = self._states.get(key)
+        if item is None:
+            return None
+        return item[0]
+
+    def set(self, key, state):
+        expires = None if self._ttl is None else time.monotonic() + self._ttl
+        self._states[key] = (state, expires)
+        self._states.move_to_end(key)
+        if self._max_size is not None and len(self._states) > self._max_size:
+            self._states.popitem(last=False)
+        self._purge()
+
+    def delete(self, key):
+        self._states.pop(key, None)
+
+    def _purge(self):
+        """
+        Private method that removes the expired states.
+        """
+        if self._ttl is None:
+            return
+
+        now = time.monotonic()
+        while self._states:
+            key, (_, expires) = next(iter(self._states.items()))
+            if expires > now:
+                break
+            del self._states[key]
+
+
+class SQLiteStateStore(StateStore):
+    """
+    On-disk state store backed by SQLite, useful in order to keep the conversations across restarts. Writes are kept in
+    memory and committed in batches, so they cost a single transaction every batch_size writes or at most flush_interval
+    seconds after the first pending write, committed by a timer also if no other write comes. The client flushes the
+    store when it stops; remember to call close() when the store is not used anymore.
+    """
+
+    _DELETED = object()  # Marker of a pending delete
+
+    def __init__(self, path, ttl=None, batch_size=100, flush_interval=1.0):
+        """
+        :param path: String, Path of the database file.
+        :param ttl: Float, Optional. Seconds after the last set in which a state expires. By default states never
+            expire.
+        :param batch_size: Integer, Optional. Number of pending writes that triggers a commit.
+        :param flush_interval: Float, Optional. Maximum seconds a write stays pending.
+        """
+        self._ttl = ttl
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._pending = dict()  # key -> (state, expiry time) or _DELETED
+        self._timer = None  # Commits the pending writes flush_interval seconds after the first one
+        self._closed = False
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS states (key PRIMARY KEY, state TEXT, expires REAL)")
+        self._connection.commit()
+
+    def get(self, key):
+        with self._lock:
+            item = self._pending.get(key)
+            if item is None:
+                row = self._connection.execute("SELECT state, expires FROM states WHERE key = ?", (key,)).fetchone()
+                item = None if row is None else (json.loads(row[0]), row[1])
+            elif item is self._DELETED:
+                item = None
+
+        if item is None or (item[1] is not None and item[1] <= time.time()):
+            return None
+        return item[0]
+
+    def set(self, key, state):
+        expires = None if self._ttl is None else time.time() + self._ttl
+        self._write(key, (state, expires))
+
+    def delete(self, key):
+        self._write(key, self._DELETED)
+
+    def flush(self):
+        """
+        Commit all the pending writes and remove the expired states.
+        """
+        with self._lock:
+            if not self._closed:
+                self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._flush()
+            self._closed = True
+            self._connection.close()
+
+    def _write(self, key, item):
+        """
+        Private method that adds a pending write, committing the batch if full.
+        """
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+            self._pending[key] = item
+            if len(self._pending) >= self._batch_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self._flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush(self):
+        """
+        Private method that commits the pending writes, the lock must be held.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        deleted = [(key,) for key, item in self._pending.items() if item is self._DELETED]
+        written = [(key, json.dumps(item[0]), item[1]) for key, item in self._pending.items()
+                   if item is not self._DELETED]
+
+        with self._connection:  # One transaction for the whole batch
+            self._connection.executemany("DELETE FROM states WHERE key = ?", deleted)
+            self._connection.executemany("INSERT OR REPLACE INTO states VALUES (?, ?, ?)", written)
+            if self._ttl is not None:
+                self._connection.execute("DELETE FROM states WHERE expires <= ?", (time.time(),))
+
+        self._pending.clear()
@@ -0,0 +1,63 @@
+import os
+import signal
+import threading
+
+
+class TerminationHandler(object):
+    """
+    SIGTERM handler of a polling loop, used by TelegramBotAPI and BotMultiplexer. It stops the loop gracefully and then
+    gives the signal to the handler installed before it, which is restored:
+
+    - if the loop runs in the main thread (run), it is only stopped: run returns after the last batch and the program
+      goes on, a previous Python handler is called as well;
+    - if the loop runs in a background thread (start), it is stopped and waited, then the previous handler is called,
+      so with the default one the process terminates as it would without the client.
+
+    Signal handlers can be changed only from the main thread, elsewhere install and restore do nothing.
+    """
+
+    def __init__(self, stop):
+        """
+        :param stop: Function, Function that stops the loop and, if in a background thread, waits for it.
+        """
+        self._stop = stop
+        self._previous = None
+        self._background = False
+        self._installed = False
+
+    def install(self, background):
+        """
+        Install the handler, keeping the previous one.
+        :param background: Boolean, True if the loop runs in a background thread.
+        """
+        if self._installed or threading.current_thread() is not threading.main_thread():
+            return
+        self._background = background
+        self._previous = signal.signal(signal.SIGTERM, self._handle)
+        self._installed = True
+
+    def restore(self):
+        """
+        Restore the previous handler.
+        """
+        if not self._installed or threading.current_thread() is not threading.main_thread():
+            return
+        signal.signal(signal.SIGTERM, self._previous if self._previous is not None else signal.SIG_DFL)
+        self._installed = False
+
+    def _handle(self, signum, frame):
+        """
+        Private method called on SIGTERM.
+        """
+        previous = self._previous
+        self._stop()
+        if not self._background:
+            if callable(previous):
+                previous(signum, frame)
+            return  # Restored by run when the loop ends
+
+        self.restore()
+        if callable(previous):
+            previous(signum, frame)
+        elif previous == signal.SIG_DFL:
+            os.kill(os.getpid(), signum)  # Terminate as without the client, now that it is stopped
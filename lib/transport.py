@@ -0,0 +1,56 @@
+import gzip
+from urllib.parse import urlencode
+
+
+class TransportStats(object):
+    """
+    Counters of the traffic with the Bot API for each method: requests, bytes sent, bytes received on the wire
+    (compressed, if the server compressed the response) and bytes of the decoded responses.
+    """
+
+    def __init__(self):
+        self._methods = dict()  # method -> [requests, sent, received, decoded]
+
+    def record(self, method, sent, received, decoded):
+        """
+        Add a request to the counters of a method.
+        :param method: String, Name of the method.
+        :param sent: Integer, Bytes of URL and body sent.
+        :param received: Integer, Bytes of the response body on the wire.
+        :param decoded: Integer, Bytes of the response body after decompression.
+        """
+        counters = self._methods.get(method)
+        if counters is None:
+            counters = self._methods[method] = [0, 0, 0, 0]
+        counters[0] += 1
+        counters[1] += sent
+        counters[2] += received
+        counters[3] += decoded
+
+    def stats(self):
+        """
+        Return a dict of method -> dict with requests, sent, received and decoded.
+        """
+        return {method: dict(zip(("requests", "sent", "received", "decoded"), counters))
+                for method, counters in self._methods.items()}
+
+    def reset(self):
+        """
+        Reset all the counters.
+        """
+        self._methods.clear()
+
+
+def encode_form(data, compress_threshold=None):
+    """
+    Encode the parameters of a POST as form, compressing them with gzip when bigger than compress_threshold.
+    :param data: Dict, Parameters, the None ones are skipped.
+    :param compress_threshold: Integer, Optional. Size in bytes above which the body is compressed, by default never.
+    :return: Tuple (body, headers).
+    """
+    body = urlencode({key: value for key, value in data.items() if value is not None}).encode("ascii")
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    if compress_threshold is not None and len(body) > compress_threshold:
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+import unittest
+
+from lib.coalescing import MessageCoalescer
+
+
+class FakeAPI(object):
+    """
+    Client that records the sent texts by chat, failing the texts in fail as a server answering with an HTML page.
+    """
+
+    debug = False
+
+    def __init__(self, fail=(), delay=0.0):
+        self.sent = []
+        self._fail = set(fail)
+        self._delay = delay
+        self._lock = threading.Lock()
+
+    def _send_message(self, data):
+        if data["text"] in self._fail:
+            return json.loads("<html>502 Bad Gateway</html>")
+        time.sleep(self._delay)
+        with self._lock:
+            self.sent.append((data["chat_id"], data["text"]))
+        return {"ok": True}
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timeout")
+        time.sleep(0.01)
+
+
+class MessageCoalescerTest(unittest.TestCase):
+
+    def test_reply_not_json_is_counted(self):
+        api = FakeAPI(fail=["lost"])
+        coalescer = MessageCoalescer(api, window=0.01)
+
+        coalescer.send({"chat_id": 1, "text": "lost"})
+        wait_for(lambda: coalescer.failed == 1)
+        coalescer.send({"chat_id": 1, "text": "sent"})  # The flushing thread is still alive
+        wait_for(lambda: api.sent == [(1, "sent")])
+        coalescer.close()
+
+    def test_keeps_order_of_each_chat(self):
+        api = FakeAPI(delay=0.001)
+        coalescer = MessageCoalescer(api, window=0.002, max_length=12, separator=" ")
+        texts = {chat_id: ["%d-%d" % (chat_id, number) for number in range(60)] for chat_id in (1, 2)}
+
+        def send(chat_id):
+            for number, text in enumerate(texts[chat_id]):
+                markup = "{}" if number % 17 == 0 else None  # Sent at once, after the text waiting
+                coalescer.send({"chat_id": chat_id, "text": text, "reply_markup": markup})
+                if number % 5 == 0:
+                    time.sleep(0.003)  # Let some windows expire
+
+        senders = [threading.Thread(target=send, args=(chat_id,)) for chat_id in texts]
+        for sender in senders:
+            sender.start()
+        for sender in senders:
+            sender.join()
+        coalescer.close()
+
+        for chat_id in texts:
+            with self.subTest(chat_id=chat_id):
+                sent = " ".join(text for chat, text in api.sent if chat == chat_id).split(" ")
+                self.assertEqual(sent, texts[chat_id])
+        self.assertGreater(coalescer.merged, 0)
@@ -0,0 +1,92 @@
+import shutil
+import tempfile
+import unittest
+
+from lib.distributed import FileQueueBackend, UpdateConsumer, UpdateProducer
+from lib.lazy import decode_update
+
+
+class FakeAPI(object):
+    """
+    Client of the producer, never polled in these tests.
+    """
+
+    offset = 0
+    lazy_updates = False
+
+
+class FakeDispatcher(object):
+    """
+    Dispatcher that records the texts, raising once for the texts in fail.
+    """
+
+    def __init__(self, fail=()):
+        self.texts = []
+        self._fail = set(fail)
+
+    def dispatch_message(self, message):
+        if message.text in self._fail:
+            self._fail.discard(message.text)
+            raise RuntimeError("Failed " + message.text)
+        self.texts.append(message.text)
+
+
+def update(update_id, text, chat_id=1):
+    return decode_update({"update_id": update_id, "message": {"message_id": update_id, "date": 0, "text": text,
+                                                              "chat": {"id": chat_id, "first_name": "Ann"},
+                                                              "from": {"id": chat_id, "first_name": "Ann"}}})
+
+
+class DistributedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.backend = FileQueueBackend(self.directory, partitions=2)
+        self.producer = UpdateProducer(FakeAPI(), self.backend)
+
+    def tearDown(self):
+        self.backend.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_records_not_committed_are_consumed_again(self):
+        self.producer.publish([update(1, "t1"), update(2, "t2")])
+
+        first = self.backend.consume(1)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(self.backend.consume(1), first)
+
+        self.backend.commit(1, first[0][0])
+        self.assertEqual(self.backend.consume(1), first[1:])
+
+    def test_failed_update_is_dispatched_again(self):
+        self.producer.publish([update(1, "t1"), update(2, "t2"), update(3, "t3")])
+        dispatcher = FakeDispatcher(fail=["t2"])
+        consumer = UpdateConsumer(dispatcher, self.backend)
+
+        self.assertEqual(consumer.consume_once(), 1)
+        self.assertEqual(consumer.failed, 1)
+        self.assertEqual(consumer.consume_once(), 2)
+        self.assertEqual(dispatcher.texts, ["t1", "t2", "t3"])
+
+        restarted = UpdateConsumer(FakeDispatcher(), FileQueueBackend(self.directory, partitions=2))
+        self.assertEqual(restarted.consume_once(), 0)  # All committed
+
+    def test_failure_does_not_stop_other_partitions(self):
+        self.producer.publish([update(1, "t1", chat_id=0), update(2, "t2", chat_id=1)])
+        dispatcher = FakeDispatcher(fail=["t1"])
+        consumer = UpdateConsumer(dispatcher, self.backend)
+
+        self.assertEqual(consumer.consume_once(), 1)
+        self.assertEqual(dispatcher.texts, ["t2"])
+        self.assertEqual(consumer.consume_once(), 1)
+        self.assertEqual(dispatcher.texts, ["t2", "t1"])
+
+    def test_payload_not_decoded_is_skipped(self):
+        self.backend.publish(1, b"{not json")
+        self.producer.publish([update(1, "t1")])
+        dispatcher = FakeDispatcher()
+        consumer = UpdateConsumer(dispatcher, self.backend)
+
+        self.assertEqual(consumer.consume_once(), 1)
+        self.assertEqual(dispatcher.texts, ["t1"])
+        self.assertEqual(self.backend.consume(1), [])
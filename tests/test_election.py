@@ -0,0 +1,130 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from lib.election import FileLeaseBackend, LeaderElection
+
+
+class FakeAPI(object):
+    """
+    Client whose every poll returns two new updates, recording who polled from which offset.
+    """
+
+    def __init__(self, name, polls, lock, dispatch_time=0.0):
+        self.name = name
+        self.offset = 0
+        self.timeout = 0
+        self._polls = polls
+        self._lock = lock
+        self._dispatch_time = dispatch_time
+
+    def getUpdates(self, timeout=None):
+        with self._lock:
+            self._polls.append((self.name, self.offset))
+        time.sleep(0.01)
+        return [self.offset, self.offset + 1]
+
+    def process_updates(self, updates, abort=None):
+        for update in updates:
+            if abort is not None and abort.is_set():
+                return
+            time.sleep(self._dispatch_time)
+            self.offset = max(self.offset, update + 1)
+
+
+class Instance(object):
+    """
+    A copy of the bot polling with leader election in its own thread.
+    """
+
+    def __init__(self, name, path, polls, lock, ttl, dispatch_time=0.0):
+        self.api = FakeAPI(name, polls, lock, dispatch_time)
+        self.election = LeaderElection(FileLeaseBackend(path), ttl=ttl, retry_interval=0.02, owner=name)
+        self._running = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._running.set()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while self._running.is_set():
+            self.election.poll(self.api)
+
+    def crash(self):
+        """
+        Stop polling without releasing the lease.
+        """
+        self._running.clear()
+        self._thread.join()
+
+    def stop(self):
+        self.crash()
+        self.election.release(self.api)
+
+
+class LeaderElectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = self.directory + "/lease"
+        self.polls = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def instance(self, name, ttl=0.3, dispatch_time=0.0):
+        return Instance(name, self.path, self.polls, self.lock, ttl, dispatch_time)
+
+    def test_only_leader_polls(self):
+        first, second = self.instance("first"), self.instance("second")
+        first.start()
+        time.sleep(0.05)
+        second.start()
+        time.sleep(0.5)
+        second.stop()  # The standby first, otherwise it takes the released lease
+        first.stop()
+
+        self.assertEqual({name for name, _ in self.polls}, {"first"})
+
+    def test_failover_resumes_from_stored_offset(self):
+        first, second = self.instance("first"), self.instance("second")
+        first.start()
+        time.sleep(0.05)
+        second.start()
+        time.sleep(0.3)
+
+        first.crash()
+        crashed_at = time.monotonic()
+        stored = first.api.offset
+        while not second.election.leader:
+            self.assertLess(time.monotonic() - crashed_at, 2.0, "The standby did not take over")
+            time.sleep(0.01)
+        time.sleep(0.1)
+        second.stop()
+
+        # Within ttl + retry_interval, and from where the crashed leader stopped
+        self.assertLess(time.monotonic() - crashed_at, 0.3 + 0.02 + 0.3)
+        second_polls = [offset for name, offset in self.polls if name == "second"]
+        self.assertEqual(second_polls[0], stored)
+
+    def test_slow_batch_keeps_lease(self):
+        first, second = self.instance("first", ttl=0.3, dispatch_time=0.25), self.instance("second", ttl=0.3)
+        first.start()
+        time.sleep(0.05)
+        second.start()
+        time.sleep(1.5)  # Every batch takes longer than ttl
+        second.stop()
+        first.stop()
+
+        offsets = [offset for name, offset in self.polls if name == "first"]
+        self.assertEqual({name for name, _ in self.polls}, {"first"})
+        self.assertEqual(offsets, list(range(0, 2 * len(offsets), 2)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import random
+import unittest
+
+from lib.geo import GeoIndex, haversine
+
+
+class GeoIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.index = GeoIndex(cell_size=0.5)
+        self.points = dict()
+        for key in range(2000):
+            latitude, longitude = rng.uniform(-90, 90), rng.uniform(-180, 180)
+            self.index.insert(key, latitude, longitude)
+            self.points[key] = (latitude, longitude)
+        for key in range(2000, 2200):  # Crowd the poles
+            latitude, longitude = rng.choice((-1, 1)) * rng.uniform(85, 90), rng.uniform(-180, 180)
+            self.index.insert(key, latitude, longitude)
+            self.points[key] = (latitude, longitude)
+
+    def brute_force(self, latitude, longitude):
+        return sorted((haversine(latitude, longitude, *point), key) for key, point in self.points.items())
+
+    def test_within_near_poles(self):
+        for latitude, longitude, radius in ((89.99, 10, 50000), (-89.9, -179.9, 300000), (88, 179.9, 1000000),
+                                            (90, 0, 20000), (0, 0, 2000000)):
+            with self.subTest(latitude=latitude, longitude=longitude, radius=radius):
+                expected = [key for distance, key in self.brute_force(latitude, longitude) if distance <= radius]
+                results = self.index.within(latitude, longitude, radius)
+                self.assertEqual(sorted(key for _, key, _ in results), sorted(expected))
+
+    def test_nearest_near_poles(self):
+        for latitude, longitude in ((89.99, 10), (-89.9, -179.9), (87.5, 179.99), (90, 0), (-90, 0)):
+            with self.subTest(latitude=latitude, longitude=longitude):
+                expected = self.brute_force(latitude, longitude)[:5]
+                results = self.index.nearest(latitude, longitude, k=5)
+                self.assertEqual([key for _, key, _ in results], [key for _, key in expected])
@@ -0,0 +1,29 @@
+import json
+import unittest
+
+from lib.lazy import decode_update
+from lib.models import Jsonable
+
+UPDATE = {"update_id": 5, "message": {"message_id": 9, "date": 1, "text": "hi",
+                                      "chat": {"id": 7, "first_name": "Ann"},
+                                      "from": {"id": 7, "first_name": "Ann", "username": "ann"},
+                                      "location": {"longitude": 9.19, "latitude": 45.46}}}
+
+
+class LazyMessageTest(unittest.TestCase):
+
+    def test_serialized_like_eager_message(self):
+        expected = json.loads(Jsonable.to_json(Jsonable.from_text(json.dumps(UPDATE))))
+
+        self.assertEqual(json.loads(Jsonable.to_json(decode_update(UPDATE))), expected)
+
+        partial = decode_update(UPDATE)
+        self.assertEqual(partial.message.text, "hi")  # Only some fields built
+        self.assertEqual(partial.message.chat.id, 7)
+        self.assertEqual(json.loads(Jsonable.to_json(partial)), expected)
+
+    def test_serialized_without_raw(self):
+        text = Jsonable.to_json(decode_update(UPDATE))
+
+        self.assertNotIn("raw", json.loads(text)["message"])
+        self.assertEqual(Jsonable.from_text(text).message.message_from.username, "ann")
@@ -0,0 +1,125 @@
+import json
+import threading
+import time
+import unittest
+
+from lib.models import Jsonable, Audio, Document, PhotoSize, Sticker, User, Video
+from lib.multiplexer import BotMultiplexer
+
+CHAT = {"id": 7, "first_name": "Ann"}
+THUMB = {"file_id": "t", "width": 90, "height": 90}
+
+
+def message(message_id, **fields):
+    message = {"message_id": message_id, "from": CHAT, "chat": CHAT, "date": 0}
+    message.update(fields)
+    return message
+
+
+class FakeServer(object):
+    """
+    Server of getUpdates that returns the updates after the offset, recording the polled offsets.
+    """
+
+    def __init__(self, updates):
+        self.updates = updates
+        self.offsets = []
+        self._lock = threading.Lock()
+
+    def call(self, method, params=None, data=None):
+        with self._lock:
+            self.offsets.append(params["offset"])
+        time.sleep(0.01)
+        result = [update for update in self.updates if update["update_id"] >= params["offset"]]
+        return json.dumps({"ok": True, "result": result})
+
+
+class ModelsTest(unittest.TestCase):
+
+    def test_decodes_files(self):
+        text = json.dumps([message(1, audio={"file_id": "a", "duration": 3}),
+                           message(2, document={"file_id": "d", "thumb": THUMB, "file_name": "x.pdf"}),
+                           message(3, sticker={"file_id": "s", "width": 512, "height": 512, "thumb": THUMB}),
+                           message(4, video={"file_id": "v", "width": 640, "height": 480, "duration": 9,
+                                             "thumb": THUMB, "mime_type": "video/mp4"})])
+        audio, document, sticker, video = Jsonable.from_text(text)
+
+        self.assertIsInstance(audio.audio, Audio)
+        self.assertIsInstance(document.document, Document)
+        self.assertIsInstance(document.document.thumb, PhotoSize)
+        self.assertIsInstance(sticker.sticker, Sticker)
+        self.assertEqual(sticker.sticker.width, 512)
+        self.assertIsInstance(video.video, Video)
+        self.assertEqual(video.video.duration, 9)
+
+
+class BotMultiplexerTest(unittest.TestCase):
+
+    def setUp(self):
+        BotMultiplexer.ERROR_DELAY = 0.05
+        self.multiplexer = BotMultiplexer()
+        self.received = dict()
+
+    def tearDown(self):
+        BotMultiplexer.ERROR_DELAY = 1.0
+        self.multiplexer.stop(5)
+
+    def bot(self, name, updates, lazy=False):
+        api = self.multiplexer.add_bot(name, bot=User(1, name))
+        server = FakeServer(updates)
+        api._call = server.call
+        api.commit_offset = lambda: None
+        api.lazy_updates = lazy
+        received = self.received[name] = []
+        if lazy:
+            api._request = lambda method, params=None, data=None: \
+                type("Response", (), {"content": server.call(method, params).encode("utf-8")})
+
+        def record(message, handled):
+            if message.photo is None:  # Builds the whole message, if lazy
+                received.append(message.message_id)
+
+        api.add_post_handler(record)
+
+        return api, server
+
+    def wait_offset(self, api, offset):
+        deadline = time.monotonic() + 5
+        while api.offset < offset:
+            if time.monotonic() > deadline:
+                raise AssertionError("Offset %d, expected %d" % (api.offset, offset))
+            time.sleep(0.01)
+
+    def test_sticker_does_not_stop_polling(self):
+        stickers, server = self.bot("stickers", [
+            {"update_id": 1, "message": message(1, text="a")},
+            {"update_id": 2, "message": message(2, sticker={"file_id": "s", "width": 1, "height": 1, "thumb": THUMB})},
+            {"update_id": 3, "message": message(3, text="b")}])
+        texts, _ = self.bot("texts", [{"update_id": 1, "message": message(1, text="c")}])
+        self.multiplexer.start()
+
+        self.wait_offset(stickers, 4)
+        self.wait_offset(texts, 2)
+        self.assertEqual(self.received, {"stickers": [1, 2, 3], "texts": [1]})
+
+    def test_undecodable_update_is_skipped(self):
+        for lazy in (False, True):
+            with self.subTest(lazy=lazy):
+                api, server = self.bot("unknown" + str(lazy), [
+                    {"update_id": 1, "message": message(1, text="a", unknown_field=True)},
+                    {"update_id": 2, "message": message(2, text="b")}], lazy)
+                self.multiplexer.start()
+
+                self.wait_offset(api, 3)
+                self.assertEqual(self.received["unknown" + str(lazy)], [2])
+                self.assertEqual(server.offsets.count(0), 1)  # Not polled again from the update that failed
+
+    def test_stopped_can_not_start(self):
+        api, _ = self.bot("stopped", [])
+        self.multiplexer.start()
+        self.assertTrue(self.multiplexer.stop(5))
+
+        with self.assertRaisesRegex(Exception, "closed"):
+            self.multiplexer.start()
+        with self.assertRaisesRegex(Exception, "closed"):
+            api.start()  # Closed by the multiplexer
@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import requests
+
+from lib.outbox import DurableOutbox
+
+
+class FakeAPI(object):
+    """
+    Client that records the delivered messages, or never returns, as a process stopped in the middle of a send.
+    """
+
+    def __init__(self, hang=False):
+        self.delivered = []
+        self._hang = threading.Event() if hang else None
+        self._lock = threading.Lock()
+
+    def _deliver_message(self, data):
+        if self._hang is not None:
+            self._hang.wait()
+            raise requests.RequestException("Crashed")
+        with self._lock:
+            self.delivered.append(data["text"])
+        return {"ok": True}
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timeout")
+        time.sleep(0.01)
+
+
+class DurableOutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.outboxes = []
+
+    def tearDown(self):
+        for outbox, api in self.outboxes:
+            if api._hang is not None:
+                api._hang.set()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def outbox(self, api, **kwargs):
+        outbox = DurableOutbox(api, self.directory, commit_interval=0.001, **kwargs)
+        outbox.RETRY_DELAY = 0.01
+        self.outboxes.append((outbox, api))
+        return outbox
+
+    def test_delivers_in_order(self):
+        api = FakeAPI()
+        outbox = self.outbox(api)
+        for i in range(50):
+            outbox.send({"chat_id": 1, "text": str(i)})
+        outbox.close()
+
+        self.assertEqual(api.delivered, [str(i) for i in range(50)])
+        self.assertEqual(outbox.sent, 50)
+        self.assertEqual(len(outbox), 0)
+
+    def test_replays_after_crash(self):
+        crashed = FakeAPI(hang=True)
+        outbox = self.outbox(crashed)
+        for i in range(10):
+            outbox.send({"chat_id": 1, "text": str(i)})
+        # The process dies here: nothing was acknowledged, the outbox is never closed
+
+        api = FakeAPI()
+        replayed = self.outbox(api)
+        wait_for(lambda: len(api.delivered) == 10)
+        replayed.close()
+
+        self.assertEqual(api.delivered, [str(i) for i in range(10)])
+
+    def test_acknowledged_are_not_replayed(self):
+        api = FakeAPI()
+        outbox = self.outbox(api)
+        for i in range(5):
+            outbox.send({"chat_id": 1, "text": str(i)})
+        wait_for(lambda: len(outbox) == 0)
+        outbox.close()
+
+        again = FakeAPI()
+        replayed = self.outbox(again)
+        replayed.send({"chat_id": 1, "text": "new"})
+        replayed.close()
+
+        self.assertEqual(again.delivered, ["new"])
+
+    def test_compaction_keeps_pending_messages(self):
+        crashed = FakeAPI(hang=True)
+        outbox = self.outbox(crashed, segment_size=256, max_segments=2)
+        for i in range(40):
+            outbox.send({"chat_id": 1, "text": "message %d" % i})
+        segments = [name for name in os.listdir(self.directory) if name.endswith(".log")]
+        self.assertLessEqual(len(segments), 4)  # Old segments are deleted, their messages copied forward
+
+        api = FakeAPI()
+        replayed = self.outbox(api)
+        wait_for(lambda: len(api.delivered) == 40)
+        replayed.close()
+
+        self.assertEqual(api.delivered, ["message %d" % i for i in range(40)])
+
+
+if __name__ == "__main__":
+    unittest.main()
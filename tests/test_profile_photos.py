@@ -0,0 +1,33 @@
+import json
+import unittest
+
+from lib import TelegramBotAPI
+from lib.models import APIError, User
+from lib.profile_photos import iter_user_profile_photos
+
+SIZES = [{"file_id": "small", "width": 160, "height": 160}, {"file_id": "big", "width": 640, "height": 640}]
+
+
+class ProfilePhotosTest(unittest.TestCase):
+
+    def api(self, replies):
+        api = TelegramBotAPI("TOKEN", bot=User(1, "bot"))
+        api._call = lambda method, params=None, data=None: json.dumps(replies.pop(0))
+        return api
+
+    def test_walks_all_pages(self):
+        api = self.api([{"ok": True, "result": {"total_count": 3, "photos": [SIZES, SIZES]}},
+                        {"ok": True, "result": {"total_count": 3, "photos": [SIZES]}}])
+
+        photos = list(iter_user_profile_photos(api, 7, page_size=2, best_fit=(100, 100)))
+        self.assertEqual([photo.file_id for photo in photos], ["small"] * 3)
+
+    def test_refused_page_raises(self):
+        api = self.api([{"ok": True, "result": {"total_count": 3, "photos": [SIZES, SIZES]}},
+                        {"ok": False, "error_code": 429, "description": "Too Many Requests"}])
+
+        photos = iter_user_profile_photos(api, 7, page_size=2)
+        self.assertEqual(len([next(photos), next(photos)]), 2)
+        with self.assertRaises(APIError) as context:
+            next(photos)
+        self.assertEqual(context.exception.error_code, 429)